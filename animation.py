@@ -0,0 +1,117 @@
+"""Frame-sequence animations played into a FrameBuffer without sleeping.
+
+An animation is a precomputed list of ``(pixels, duration)`` frames.
+:class:`Animator` queues them and :meth:`Animator.tick` shows whichever
+frame is due, returning how long until the next change so the caller
+can schedule the following tick (e.g. with ``loop.call_later``).
+"""
+from collections import deque
+from typing import Callable, List, Optional, Sequence, Tuple
+
+CLEAR = (0, 0, 0)
+WHITE = [255, 255, 255]
+
+Frame = Tuple[Optional[Sequence[Sequence[int]]], float]
+
+
+def still(pixels: Sequence[Sequence[int]], duration: float) -> List[Frame]:
+    """A single frame held for ``duration`` seconds."""
+    return [(pixels, duration)]
+
+
+def text_frames(sense, text: str, text_colour: Sequence[int], back_colour: Sequence[int] = CLEAR,
+                scroll_speed: float = 0.1) -> List[Frame]:
+    """Precompute the frames ``sense.show_message`` would scroll through.
+
+    Uses the Sense HAT's own font (``_get_char_pixels``), whose glyphs are
+    stored column by column; show_message draws them with the display
+    rotated by 90 degrees, here the columns are transposed into ordinary
+    row-major frames instead.
+    """
+    padding = [None] * 64
+    columns = list(padding)
+    for s in text:
+        columns.extend(sense._trim_whitespace(sense._get_char_pixels(s)))
+        columns.extend([None] * 8)
+    columns.extend(padding)
+    coloured = [tuple(text_colour) if pixel == WHITE else tuple(back_colour) for pixel in columns]
+
+    frames = []
+    for i in range(len(coloured) // 8 - 8):
+        window = coloured[i * 8:i * 8 + 64]
+        # window[col * 8 + k] は左から col 列目、下から k 行目の画素
+        frames.append(([window[col * 8 + 7 - row] for row in range(8) for col in range(8)], scroll_speed))
+    return frames
+
+
+class Animator:
+    """Plays queued frame sequences one after another.
+
+    While an animation is playing it owns the display: callers that
+    composite the board (redraw_area) should check :attr:`active` and
+    redraw everything from ``on_done`` instead.
+    """
+
+    def __init__(self, fb):
+        self.fb = fb
+        self._queue = deque()  # (frames, on_done)
+        self._current = None
+        self._index = -1
+        self._due = 0.0
+        self._ticking = False
+        # 待ち行列が空の状態で play された時に呼ばれる（tick の予約に使う）
+        self.on_start: Callable[[], None] = None
+        self.frames_shown = 0
+        self.frames_skipped = 0
+
+    @property
+    def active(self) -> bool:
+        return self._current is not None or bool(self._queue)
+
+    def play(self, frames: Sequence[Frame], on_done: Callable[[], None] = None):
+        """Queue ``frames``; ``on_done`` runs after the last one has been held."""
+        idle = not self.active
+        self._queue.append((list(frames), on_done))
+        if idle and not self._ticking and self.on_start is not None:
+            self.on_start()
+
+    def cancel(self):
+        """Drop the current and queued animations without running their on_done."""
+        self._queue.clear()
+        self._current = None
+
+    def tick(self, now: float) -> Optional[float]:
+        """Show the frame due at ``now``; seconds until the next change, None when idle."""
+        self._ticking = True
+        try:
+            return self._advance(now)
+        finally:
+            self._ticking = False
+
+    def _advance(self, now: float) -> Optional[float]:
+        shown = False
+        while True:
+            if self._current is None:
+                if not self._queue:
+                    return None
+                self._current = self._queue.popleft()
+                self._index = -1
+                self._due = now
+            if now < self._due:
+                return self._due - now
+            frames, on_done = self._current
+            self._index += 1
+            if self._index < len(frames):
+                pixels, duration = frames[self._index]
+                if shown:
+                    # 遅れて呼ばれた時は期限切れのフレームを飛ばして追いつく
+                    self.frames_skipped += 1
+                if pixels is not None:
+                    self.fb.set_pixels(pixels)
+                shown = True
+                self.frames_shown += 1
+                self._due += duration
+            else:
+                self._current = None
+                if on_done is not None:
+                    on_done()
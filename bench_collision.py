@@ -0,0 +1,91 @@
+"""Catch checks: per-pixel cursor lists vs 64-bit footprint masks.
+
+Places N cursors of random size on an 8x8 board and, for each cursor in
+turn, asks "who is caught if this cursor has just moved here".  The list
+path does what cursor_enter used to do (build the list of cursors
+covering the pixel, then scan it); the mask path ANDs precomputed
+footprint masks; the batch path resolves every runner for the hunter in
+a single caught_by call.
+
+Usage: python bench_collision.py [rounds]
+"""
+import random
+import sys
+import time
+
+from collision import caught_by, covering, footprint_mask, pixel_bit
+
+WIDTH, HEIGHT = 8, 8
+HUNTER_ID = 0
+
+
+def layout(n, seed=0):
+    rand = random.Random(seed)
+    footprints = {}
+    for cid in range(n):
+        size = rand.choice((1, 2, 2, 3))
+        footprints[cid] = (rand.randrange(WIDTH - size + 1), rand.randrange(HEIGHT - size + 1), size)
+    return footprints
+
+
+def covers(footprint, x, y):
+    fx, fy, size = footprint
+    return fx <= x < fx + size and fy <= y < fy + size
+
+
+def check_lists(footprints, target_id):
+    x, y, _ = footprints[target_id]
+    overlapping = [cid for cid, fp in footprints.items() if covers(fp, x, y)]
+    if target_id != HUNTER_ID:
+        return [target_id] if any(cid == HUNTER_ID for cid in overlapping) else []
+    return [cid for cid in overlapping if cid != HUNTER_ID]
+
+
+def check_masks(footprints, masks, target_id):
+    x, y, _ = footprints[target_id]
+    if target_id != HUNTER_ID:
+        return [target_id] if masks.get(HUNTER_ID, 0) & pixel_bit(x, y) else []
+    return [cid for cid in covering(masks, x, y) if cid != HUNTER_ID]
+
+
+def run(n, rounds):
+    footprints = layout(n)
+    masks = {cid: footprint_mask(*fp) for cid, fp in footprints.items()}
+    expected = sorted(
+        [cid for cid in footprints if cid != HUNTER_ID and check_lists(footprints, cid)]
+        + check_lists(footprints, HUNTER_ID)
+    )
+    assert sorted(set(caught_by(HUNTER_ID, footprints))) == sorted(set(expected))
+
+    results = {}
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for cid in footprints:
+            check_lists(footprints, cid)
+    results["lists"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for cid in footprints:
+            check_masks(footprints, masks, cid)
+    results["masks"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        caught_by(HUNTER_ID, footprints)
+    results["batch"] = time.perf_counter() - start
+    return results
+
+
+def main():
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    print(f"{'cursors':<10}{'path':<8}{'us/round':>12}{'speedup':>10}")
+    for n in (4, 16, 64):
+        results = run(n, rounds)
+        base = results["lists"]
+        for name, elapsed in results.items():
+            print(f"{n:<10}{name:<8}{elapsed / rounds * 1e6:>12.2f}{base / elapsed:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
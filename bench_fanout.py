@@ -0,0 +1,63 @@
+"""Sender-side cost of cluster-wide commands: unicast loop vs one multicast send.
+
+Measures how long the sending Pi spends putting one SHUFFLE, PURPLE or
+BOOST on the wire for clusters of 4, 16 and 64 nodes.
+
+Usage: python bench_fanout.py [events]
+"""
+import socket
+import sys
+import time
+
+import protocol
+from transport import UdpTransport
+
+NODE_COUNTS = (4, 16, 64)
+GROUP = "239.255.10.1"
+PORT = 5099
+
+
+def sample_fields(opcode, nodes):
+    if opcode == protocol.SHUFFLE:
+        return (time.time() + 5, *range(min(nodes, 255)))
+    if opcode == protocol.PURPLE:
+        return (1, 3, 4)
+    return (1, time.time() + 5)
+
+
+def main():
+    events = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    transport = UdpTransport("127.0.0.1", PORT)
+    try:
+        transport.join_group(GROUP, "127.0.0.1")
+        transport.sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_LOOP, 0)
+    except OSError as e:
+        print(f"multicast unavailable: {e}")
+
+    print(f"{'message':<9}{'nodes':>6}{'unicast us':>12}{'dgrams':>8}{'multicast us':>14}{'dgrams':>8}")
+    try:
+        for opcode in (protocol.SHUFFLE, protocol.PURPLE, protocol.BOOST):
+            for nodes in NODE_COUNTS:
+                addrs = ["127.0.0.1"] * nodes
+                data = protocol.encode(opcode, 0, 1, sample_fields(opcode, nodes))
+
+                start = time.perf_counter()
+                for _ in range(events):
+                    transport.send_many(data, addrs)
+                unicast = (time.perf_counter() - start) / events * 1e6
+
+                multicast = float("nan")
+                if transport.group is not None:
+                    start = time.perf_counter()
+                    for _ in range(events):
+                        transport.send_group(data)
+                    multicast = (time.perf_counter() - start) / events * 1e6
+
+                print(f"{protocol.opcode_name(opcode):<9}{nodes:>6}{unicast:>12.1f}{nodes:>8}"
+                      f"{multicast:>14.1f}{1:>8}")
+    finally:
+        transport.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""Display writes for cursor moves: per-pixel set_pixel vs FrameBuffer flushes.
+
+Replays random moves of a 2x2 cursor.  The direct path does what
+draw_cursor used to do (one set_pixel per covered pixel for the leave
+and for the enter); the buffered path draws into a FrameBuffer and
+flushes once per move.
+
+Usage: python bench_framebuffer.py [moves]
+"""
+import os
+import random
+import sys
+import time
+
+from framebuffer import FrameBuffer
+
+if os.environ.get("SENSE_BACKEND") == "headless":
+    from headless_hat import SenseHat
+else:
+    try:
+        from sense_hat import SenseHat
+    except Exception:
+        try:
+            from sense_emu import SenseHat
+        except Exception:
+            from headless_hat import SenseHat
+
+RED = (255, 0, 0)
+CLEAR = (0, 0, 0)
+SIZE = 2
+
+
+def moves(n, seed=0):
+    rand = random.Random(seed)
+    x = y = 0
+    for _ in range(n):
+        nx = min(8 - SIZE, max(0, x + rand.choice((-1, 0, 1))))
+        ny = min(8 - SIZE, max(0, y + rand.choice((-1, 0, 1))))
+        yield x, y, nx, ny
+        x, y = nx, ny
+
+
+def draw(target, x, y, color):
+    for dx in range(SIZE):
+        for dy in range(SIZE):
+            target.set_pixel(x + dx, y + dy, color)
+
+
+def run_direct(display, n):
+    writes = 0
+    start = time.perf_counter()
+    for x, y, nx, ny in moves(n):
+        draw(display, x, y, CLEAR)
+        draw(display, nx, ny, RED)
+        writes += 2 * SIZE * SIZE
+    return writes, time.perf_counter() - start
+
+
+def run_buffered(display, n):
+    fb = FrameBuffer(display)
+    start = time.perf_counter()
+    for x, y, nx, ny in moves(n):
+        draw(fb, x, y, CLEAR)
+        draw(fb, nx, ny, RED)
+        fb.flush()
+    return fb.flushes, time.perf_counter() - start
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    display = SenseHat()
+    print(f"display: {type(display).__module__}.{type(display).__name__}, {n} moves")
+    print(f"{'path':<10}{'writes':>10}{'writes/move':>13}{'moves/s':>12}")
+    for name, fn in (("direct", run_direct), ("buffered", run_buffered)):
+        writes, elapsed = fn(display, n)
+        print(f"{name:<10}{writes:>10}{writes / n:>13.2f}{n / elapsed:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""Crossing latency of the legacy CROSS/DRAW relay versus one-hop handoff.
+
+Three loopback sockets stand in for the owner Pi, the Pi the cursor is
+leaving (host) and the Pi it enters (dest).  Each crossing is timed from
+the moment the host detects it until dest has decoded the DRAW.
+
+Usage: python bench_handoff.py [crossings] [link delay ms]
+"""
+import socket
+import statistics
+import sys
+import time
+
+import protocol
+
+OWNER, HOST, DEST = 1, 0, 2
+
+
+def make_socket():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(("127.0.0.1", 0))
+    return sock
+
+
+def hop(src, dst, data, link_delay):
+    """Send one datagram and receive it on ``dst`` (plus simulated wire delay)."""
+    if link_delay:
+        time.sleep(link_delay)
+    src.sendto(data, dst.getsockname())
+    return protocol.decode(dst.recv(1024))
+
+
+def legacy_crossing(socks, link_delay):
+    """host -> owner: CROSS, owner -> dest: DRAW."""
+    start = time.perf_counter()
+    msg = hop(socks[HOST], socks[OWNER],
+              protocol.encode(protocol.CROSS, HOST, 1, (DEST, 0, 3, OWNER)), link_delay)
+    next_pi, x, y, cursor_id = msg.fields
+    hop(socks[OWNER], socks[DEST],
+        protocol.encode(protocol.DRAW, OWNER, 1, (x, y, OWNER, cursor_id)), link_delay)
+    return time.perf_counter() - start
+
+
+def handoff_crossing(socks, link_delay):
+    """host -> dest: DRAW; the LOCATE to the owner is off the critical path."""
+    start = time.perf_counter()
+    hop(socks[HOST], socks[DEST],
+        protocol.encode(protocol.DRAW, HOST, 1, (0, 3, OWNER, OWNER)), link_delay)
+    elapsed = time.perf_counter() - start
+    socks[HOST].sendto(protocol.encode(protocol.LOCATE, HOST, 2, (OWNER, DEST)),
+                       socks[OWNER].getsockname())
+    socks[OWNER].recv(1024)
+    return elapsed
+
+
+def measure(fn, socks, n, link_delay):
+    samples = sorted(fn(socks, link_delay) * 1e6 for _ in range(n))
+    return statistics.mean(samples), samples[len(samples) // 2], samples[int(len(samples) * 0.99)]
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    link_delay = float(sys.argv[2]) / 1000 if len(sys.argv) > 2 else 0.0
+    socks = {pi: make_socket() for pi in (OWNER, HOST, DEST)}
+    try:
+        print(f"{n} crossings, simulated link delay {link_delay * 1000:.1f} ms")
+        print(f"{'protocol':<10}{'mean us':>10}{'p50 us':>10}{'p99 us':>10}")
+        for name, fn in (("legacy", legacy_crossing), ("handoff", handoff_crossing)):
+            mean, p50, p99 = measure(fn, socks, n, link_delay)
+            print(f"{name:<10}{mean:>10.1f}{p50:>10.1f}{p99:>10.1f}")
+    finally:
+        for sock in socks.values():
+            sock.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""Compare the old space-delimited text commands with the binary protocol.
+
+Usage: python bench_protocol.py [iterations]
+"""
+import sys
+import timeit
+
+import protocol
+
+# (text form, opcode, fields) for a representative message of each kind
+SAMPLES = [
+    ("MOVE up 1 42", protocol.MOVE, (0, 1, 42)),
+    ("DRAW 6 2 1 1", protocol.DRAW, (6, 2, 1, 1)),
+    ("CROSS 2 0 6 1", protocol.CROSS, (2, 0, 6, 1)),
+    ("CATCH 2 1 3", protocol.CATCH, (1, 3)),
+    ("SHUFFLE 1760800000.25 3,0,2,1", protocol.SHUFFLE, (1760800000.25, 3, 0, 2, 1)),
+    ("PURPLE 2 5 7", protocol.PURPLE, (2, 5, 7)),
+    ("BOOST 1 1760800005.5", protocol.BOOST, (1, 1760800005.5)),
+]
+
+
+def parse_text(data):
+    """The parsing done by the old network_listener."""
+    parts = data.decode().split(' ')
+    command = parts[0]
+    if command == "MOVE":
+        return command, (parts[1], int(parts[2]), int(parts[3]))
+    if command in ("DRAW", "CROSS", "CHECK"):
+        return command, (int(parts[1]), int(parts[2]), int(parts[3]), int(parts[4]))
+    if command == "CATCH":
+        num = int(parts[1])
+        return command, tuple(map(int, parts[2:2 + num]))
+    if command == "SHUFFLE":
+        return command, (float(parts[1]), *map(int, parts[2].split(',')))
+    if command == "PURPLE":
+        return command, (int(parts[1]), int(parts[2]), int(parts[3]))
+    return command, (int(parts[1]), float(parts[2]))
+
+
+def format_text(command, values):
+    """The formatting done by the old senders."""
+    if command == "CATCH":
+        return (f"CATCH {len(values)} " + " ".join(map(str, values))).encode()
+    if command == "SHUFFLE":
+        return f"SHUFFLE {values[0]} {','.join(map(str, values[1:]))}".encode()
+    return " ".join([command, *map(str, values)]).encode()
+
+
+def per_call(fn, n):
+    # 他のプロセスの影響を受けにくいよう、5 回計って最短を使う
+    return min(timeit.repeat(fn, number=n, repeat=5)) / n * 1e6
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    print(f"{'message':<32}{'text B':>7}{'bin B':>7}{'text enc':>10}{'bin enc':>10}"
+          f"{'text dec':>10}{'bin dec':>10}   (us/msg)")
+    for text, opcode, fields in SAMPLES:
+        text_data = text.encode()
+        bin_data = protocol.encode(opcode, 0, 1, fields)
+        assert protocol.decode(bin_data).fields == tuple(fields)
+
+        command, values = parse_text(text_data)
+        assert format_text(command, values) == text_data
+        t_enc = per_call(lambda: format_text(command, values), n)
+        b_enc = per_call(lambda: protocol.encode(opcode, 0, 1, fields), n)
+        t_dec = per_call(lambda: parse_text(text_data), n)
+        b_dec = per_call(lambda: protocol.decode(bin_data), n)
+        print(f"{text:<32}{len(text_data):>7}{len(bin_data):>7}"
+              f"{t_enc:>10.2f}{b_enc:>10.2f}{t_dec:>10.2f}{b_dec:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
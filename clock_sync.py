@@ -0,0 +1,51 @@
+"""NTP-style offset estimation against a reference node.
+
+Each exchange records four timestamps: t0 (request sent, local clock),
+t1 (request received, reference clock), t2 (response sent, reference
+clock) and t3 (response received, local clock).  The offset of the
+reference clock is ``((t1 - t0) + (t2 - t3)) / 2`` and the round trip
+spent on the network is ``(t3 - t0) - (t2 - t1)``.  The sample with the
+smallest round trip in a sliding window is the least disturbed by
+queueing, so its offset is used.
+"""
+import statistics
+import time
+from collections import deque
+
+
+class ClockSync:
+    """Cluster time = local ``time.time()`` plus the estimated offset."""
+
+    def __init__(self, window: int = 8):
+        self.offset = 0.0
+        self.delay = None
+        self.samples = deque(maxlen=window)  # (delay, offset)
+
+    def now(self) -> float:
+        """Current cluster time."""
+        return time.time() + self.offset
+
+    def to_local(self, cluster_time: float) -> float:
+        """Convert a cluster timestamp into this node's ``time.time()`` scale."""
+        return cluster_time - self.offset
+
+    def on_response(self, t0: float, t1: float, t2: float, t3: float):
+        delay = (t3 - t0) - (t2 - t1)
+        offset = ((t1 - t0) + (t2 - t3)) / 2
+        self.samples.append((delay, offset))
+        self.delay, self.offset = min(self.samples)
+
+    @property
+    def jitter(self) -> float:
+        """Spread (stdev) of the offsets in the current window."""
+        if len(self.samples) < 2:
+            return 0.0
+        return statistics.pstdev(offset for _, offset in self.samples)
+
+    def stats(self):
+        return {
+            "offset": self.offset,
+            "delay": self.delay,
+            "jitter": self.jitter,
+            "samples": len(self.samples),
+        }
@@ -0,0 +1,65 @@
+"""64-bit footprint masks for the 8x8 board.
+
+Bit ``y * 8 + x`` stands for pixel (x, y).  The footprint of every
+(x, y, size) is precomputed, so collision tests are single ANDs.
+"""
+from typing import Dict, List, Tuple
+
+WIDTH, HEIGHT = 8, 8
+MAX_SIZE = 8
+
+
+def pixel_bit(x: int, y: int) -> int:
+    return 1 << (y * WIDTH + x)
+
+
+def _build_footprints() -> Dict[int, List[int]]:
+    table = {}
+    for size in range(1, MAX_SIZE + 1):
+        masks = []
+        for y in range(HEIGHT):
+            for x in range(WIDTH):
+                mask = 0
+                # 盤面からはみ出す部分は切り捨てる
+                for dy in range(size):
+                    for dx in range(size):
+                        if x + dx < WIDTH and y + dy < HEIGHT:
+                            mask |= pixel_bit(x + dx, y + dy)
+                masks.append(mask)
+        table[size] = masks
+    return table
+
+
+# size -> [mask for y * WIDTH + x]
+FOOTPRINTS = _build_footprints()
+
+
+def footprint_mask(x: int, y: int, size: int) -> int:
+    return FOOTPRINTS[size][y * WIDTH + x]
+
+
+def covering(masks: Dict[int, int], x: int, y: int) -> List[int]:
+    """Ids whose footprint covers (x, y)."""
+    bit = pixel_bit(x, y)
+    return [cid for cid, mask in masks.items() if mask & bit]
+
+
+def caught_by(hunter_id: int, footprints: Dict[int, Tuple[int, int, int]]) -> List[int]:
+    """All runners caught by the hunter, checked in one pass.
+
+    Uses the same rule as cursor_enter: a runner is caught when the
+    hunter covers the runner's top-left pixel or the runner covers the
+    hunter's top-left pixel.
+    """
+    hunter = footprints.get(hunter_id)
+    if hunter is None:
+        return []
+    hunter_mask = footprint_mask(*hunter)
+    hunter_point = pixel_bit(hunter[0], hunter[1])
+    caught = []
+    for cid, (x, y, size) in footprints.items():
+        if cid == hunter_id:
+            continue
+        if hunter_mask & pixel_bit(x, y) or footprint_mask(x, y, size) & hunter_point:
+            caught.append(cid)
+    return caught
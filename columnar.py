@@ -0,0 +1,73 @@
+"""Small column-oriented file format built on :mod:`array` and zlib.
+
+Layout::
+
+    b"GCOL1\\n"  !I header length  JSON header  column blobs...
+
+The header lists every column's name, ``array`` typecode and compressed
+size; each blob is the zlib-compressed raw array.  Integers are stored
+as ``q``, floats as ``d`` (None becomes NaN) and booleans as ``b``.
+"""
+import array
+import json
+import math
+import struct
+import sys
+import zlib
+from typing import Dict, List, Sequence
+
+MAGIC = b"GCOL1\n"
+_LENGTH = struct.Struct("!I")
+
+
+def _typecode(values: Sequence) -> str:
+    if all(isinstance(v, bool) for v in values):
+        return "b"
+    if all(isinstance(v, int) and not isinstance(v, bool) for v in values):
+        return "q"
+    return "d"
+
+
+def write_columns(path: str, columns: Dict[str, Sequence]):
+    lengths = {len(values) for values in columns.values()}
+    if len(lengths) > 1:
+        raise ValueError(f"columns have different lengths: {sorted(lengths)}")
+    blobs = []
+    meta = []
+    for name, values in columns.items():
+        code = _typecode(values)
+        if code == "d":
+            values = [math.nan if v is None else float(v) for v in values]
+        blob = zlib.compress(array.array(code, values).tobytes())
+        blobs.append(blob)
+        meta.append({"name": name, "typecode": code, "size": len(blob)})
+    header = json.dumps({
+        "rows": lengths.pop() if lengths else 0,
+        "byteorder": sys.byteorder,
+        "columns": meta,
+    }).encode()
+    with open(path, "wb") as f:
+        f.write(MAGIC)
+        f.write(_LENGTH.pack(len(header)))
+        f.write(header)
+        for blob in blobs:
+            f.write(blob)
+
+
+def read_columns(path: str) -> Dict[str, List]:
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a columnar file")
+        (length,) = _LENGTH.unpack(f.read(_LENGTH.size))
+        header = json.loads(f.read(length))
+        columns = {}
+        for meta in header["columns"]:
+            values = array.array(meta["typecode"])
+            values.frombytes(zlib.decompress(f.read(meta["size"])))
+            if header["byteorder"] != sys.byteorder:
+                values.byteswap()
+            values = values.tolist()
+            if meta["typecode"] == "b":
+                values = [bool(v) for v in values]
+            columns[meta["name"]] = values
+    return columns
@@ -0,0 +1,83 @@
+"""Leveled JSON-lines event log written off the hot path.
+
+:meth:`EventLog.log` only appends a tuple to a bounded ``deque`` (append
+and popleft are atomic, so producers never take a lock).  A background
+thread drains it every ``flush_interval`` seconds, formats the records
+as JSON lines and writes them with a single ``write`` call.  When the
+buffer is full the oldest records are dropped and counted.
+
+Records below the current level return before doing any work; guard
+expensive debug dumps with :meth:`EventLog.enabled`.
+"""
+import json
+import sys
+import threading
+import time
+from collections import deque
+
+DEBUG, INFO, WARNING, ERROR = 10, 20, 30, 40
+LEVEL_NAMES = {DEBUG: "debug", INFO: "info", WARNING: "warning", ERROR: "error"}
+LEVELS = {name: level for level, name in LEVEL_NAMES.items()}
+
+
+class EventLog:
+    def __init__(self, stream=None, level: int = INFO, capacity: int = 4096, flush_interval: float = 0.05):
+        self.stream = stream if stream is not None else sys.stdout
+        self.level = level
+        self.capacity = capacity
+        self.flush_interval = flush_interval
+        self._records = deque(maxlen=capacity)  # (time, level, event, fields)
+        self.dropped = 0
+        self.written = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def enabled(self, level: int) -> bool:
+        return level >= self.level
+
+    def log(self, level: int, event: str, **fields):
+        if level < self.level:
+            return
+        if len(self._records) == self.capacity:
+            self.dropped += 1  # maxlen の deque が一番古いものを捨てる
+        self._records.append((time.time(), level, event, fields))
+
+    def debug(self, event: str, **fields):
+        self.log(DEBUG, event, **fields)
+
+    def info(self, event: str, **fields):
+        self.log(INFO, event, **fields)
+
+    def warning(self, event: str, **fields):
+        self.log(WARNING, event, **fields)
+
+    def error(self, event: str, **fields):
+        self.log(ERROR, event, **fields)
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="event-log", daemon=True)
+        self._thread.start()
+
+    def close(self):
+        """Stop the writer thread after writing everything still buffered."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+
+    def flush(self):
+        records = self._records
+        lines = []
+        while records:
+            t, level, event, fields = records.popleft()
+            lines.append(json.dumps({"t": t, "level": LEVEL_NAMES[level], "event": event, **fields}, default=str))
+        if lines:
+            self.stream.write("\n".join(lines) + "\n")
+            self.stream.flush()
+            self.written += len(lines)
@@ -0,0 +1,53 @@
+"""Always-on flight recorder: the last N events of a node, dumped on demand.
+
+:meth:`FlightRecorder.record` appends ``(time, kind, data)`` to a
+``deque`` with a fixed ``maxlen`` -- no formatting, no locks, constant
+memory -- so it can stay on during real games.  :meth:`FlightRecorder.dump`
+copies the buffer and writes it from a separate thread as JSON lines:
+a header with the reason and the ``state_fn()`` snapshot, then one line
+per event, oldest first.
+"""
+import json
+import os
+import threading
+import time
+from collections import deque
+from typing import Callable, Optional
+
+
+class FlightRecorder:
+    def __init__(self, capacity: int = 4096, directory: str = "flight_records", name: str = "node",
+                 state_fn: Optional[Callable[[], dict]] = None):
+        self.capacity = capacity
+        self.directory = directory
+        self.name = name
+        # dump 時点の状態（devices など）を返す
+        self.state_fn = state_fn
+        self._events = deque(maxlen=capacity)
+        self.dumps = 0
+        self.last_path = None
+
+    def record(self, kind: str, *data):
+        self._events.append((time.time(), kind, data))
+
+    def dump(self, reason: str) -> str:
+        """Write the buffered events to a new file and return its path."""
+        events = list(self._events)
+        header = {"reason": reason, "t": time.time(), "capacity": self.capacity, "events": len(events)}
+        if self.state_fn is not None:
+            header["state"] = self.state_fn()
+        self.dumps += 1
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        path = os.path.join(self.directory, f"{self.name}-{stamp}-{self.dumps:03d}-{reason}.jsonl")
+        self.last_path = path
+        # 書き込みはイベントループを止めないよう別スレッドで。終了時は daemon でないので書き終わるまで待つ
+        threading.Thread(target=self._write, args=(path, header, events), name="flight-dump").start()
+        return path
+
+    def _write(self, path, header, events):
+        os.makedirs(self.directory, exist_ok=True)
+        lines = [json.dumps(header, default=str)]
+        for t, kind, data in events:
+            lines.append(json.dumps({"t": t, "kind": kind, "data": data}, default=str))
+        with open(path, "w") as f:
+            f.write("\n".join(lines) + "\n")
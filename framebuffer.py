@@ -0,0 +1,62 @@
+from typing import Callable, List, Sequence
+
+CLEAR = (0, 0, 0)
+
+
+class FrameBuffer:
+    """In-memory copy of the 8x8 LED matrix.
+
+    Drawing code writes here; :meth:`flush` pushes the whole frame to the
+    Sense HAT with a single ``set_pixels`` call, and only when something
+    actually changed since the last flush.
+    """
+
+    def __init__(self, sense, width: int = 8, height: int = 8):
+        self.sense = sense
+        self.width = width
+        self.height = height
+        self.pixels: List[tuple] = [CLEAR] * (width * height)
+        self.dirty = False
+        # 最初の変更で呼ばれる（flush の予約に使う）
+        self.on_dirty: Callable[[], None] = None
+        self.flushes = 0
+        self.skipped_flushes = 0
+
+    def _mark_dirty(self):
+        if not self.dirty:
+            self.dirty = True
+            if self.on_dirty is not None:
+                self.on_dirty()
+
+    def set_pixel(self, x: int, y: int, color: Sequence[int]):
+        color = tuple(color)
+        idx = y * self.width + x
+        if self.pixels[idx] != color:
+            self.pixels[idx] = color
+            self._mark_dirty()
+
+    def get_pixel(self, x: int, y: int) -> tuple:
+        return self.pixels[y * self.width + x]
+
+    def set_pixels(self, pixels: Sequence[Sequence[int]]):
+        pixels = [tuple(c) for c in pixels]
+        if pixels != self.pixels:
+            self.pixels = pixels
+            self._mark_dirty()
+
+    def clear(self, color: Sequence[int] = CLEAR):
+        self.set_pixels([color] * (self.width * self.height))
+
+    def invalidate(self):
+        """Force the next flush, e.g. after something drew on the HAT directly."""
+        self._mark_dirty()
+
+    def flush(self) -> bool:
+        """Write the frame to the display if it changed; True if written."""
+        if not self.dirty:
+            self.skipped_flushes += 1
+            return False
+        self.dirty = False
+        self.sense.set_pixels(self.pixels)
+        self.flushes += 1
+        return True
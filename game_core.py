@@ -0,0 +1,353 @@
+"""Rules of the tag game, free of sockets, displays and wall-clock time.
+
+The board functions (:func:`compute_adj_from_layout`,
+:func:`get_new_position`, :func:`get_next_pi`) are shared with the node
+script.  :class:`Game` plays a whole seeded game on a virtual clock with
+the same movement, catch, purple (boost/freeze) and shuffle rules as the
+cluster, and :func:`run_batch` aggregates outcomes over many seeds so
+settings such as ``purple_interval`` or cursor sizes can be tuned
+statistically.
+
+Usage: python game_core.py [--games N] [--seed S] [--<config field> VALUE ...]
+"""
+import argparse
+import dataclasses
+import random
+import statistics
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from collision import FOOTPRINTS
+from protocol import DIRECTIONS
+
+WIDTH, HEIGHT = 8, 8
+# 隣接するラズパイが存在しないことを示す値
+NO_NEIGHBOR = 9
+
+_DIRECTION_INDEX = {d: i for i, d in enumerate(DIRECTIONS)}
+_NO_ADJ = (NO_NEIGHBOR,) * 4
+
+
+def compute_adj_from_layout(order: List[int]) -> Dict[int, Tuple[int, int, int, int]]:
+    """Compute (up, right, down, left) adjacency from the current layout."""
+
+    # Map layout positions to their neighbour positions on a 2x2 grid
+    mapping = {
+        0: {"up": None, "right": 1, "down": 2, "left": None},
+        1: {"up": None, "right": None, "down": 3, "left": 0},
+        2: {"up": 0, "right": 3, "down": None, "left": None},
+        3: {"up": 1, "right": None, "down": None, "left": 2},
+    }
+
+    padded = order + [NO_NEIGHBOR] * (4 - len(order))
+    result = {}
+
+    for pos, dev_id in enumerate(padded):
+        if dev_id == NO_NEIGHBOR:
+            continue
+        neighbours = mapping[pos]
+        adj = (
+            padded[neighbours["up"]] if neighbours["up"] is not None else NO_NEIGHBOR,
+            padded[neighbours["right"]] if neighbours["right"] is not None else NO_NEIGHBOR,
+            padded[neighbours["down"]] if neighbours["down"] is not None else NO_NEIGHBOR,
+            padded[neighbours["left"]] if neighbours["left"] is not None else NO_NEIGHBOR,
+        )
+        result[dev_id] = adj
+
+    return result
+
+
+def get_new_position(old_x, old_y, direction, size, step, adj):
+    """Return the next position of a cursor and whether it crossed to another Pi."""
+    hasCrossed = False
+
+    # Compute tentative position based on direction and step size
+    new_x, new_y = old_x, old_y
+    if direction == "up":
+        new_y -= step
+    if direction == "down":
+        new_y += step
+    if direction == "left":
+        new_x -= step
+    if direction == "right":
+        new_x += step
+
+    # Vertical bounds
+    if new_y < 0:
+        if adj[0] != NO_NEIGHBOR:
+            new_y = HEIGHT - size
+            hasCrossed = True
+        else:
+            new_y = 0
+    elif new_y > HEIGHT - size:
+        if adj[2] != NO_NEIGHBOR:
+            new_y = 0
+            hasCrossed = True
+        else:
+            new_y = HEIGHT - size
+
+    # Horizontal bounds
+    if new_x < 0:
+        if adj[3] != NO_NEIGHBOR:
+            new_x = WIDTH - size
+            hasCrossed = True
+        else:
+            new_x = 0
+    elif new_x > WIDTH - size:
+        if adj[1] != NO_NEIGHBOR:
+            new_x = 0
+            hasCrossed = True
+        else:
+            new_x = WIDTH - size
+
+    return new_x, new_y, hasCrossed
+
+
+# 遷移先のPiを求める
+def get_next_pi(direction, adj: Tuple[int, int, int, int]):
+    idx = _DIRECTION_INDEX.get(direction)
+    if idx is None:
+        return -1
+    return adj[idx] if adj[idx] != NO_NEIGHBOR else -1
+
+
+def random_coordinate(max_value, step, rng=random):
+    values = list(range(0, max_value + 1, step))
+    return rng.choice(values)
+
+
+@dataclass
+class GameConfig:
+    time_limit: float = 180.0
+    tick: float = 0.2
+    purple_interval: float = 10.0
+    boost_duration: float = 5.0
+    shuffle_lock: float = 5.0
+    # シャッフルボタンが押される頻度（ゲーム内 1 秒あたり）
+    shuffle_rate: float = 0.0
+    cursor_sizes: Tuple[int, ...] = (2, 1, 1, 1)
+    move_steps: Tuple[int, ...] = (2, 1, 1, 1)
+    start: Tuple[int, int] = (2, 2)
+    hunter_id: int = 0
+    # プレイヤーの傾け方: tick ごとに傾けている確率と、方向を変える確率
+    move_prob: float = 0.7
+    turn_prob: float = 0.3
+
+
+@dataclass
+class GameResult:
+    seed: int
+    hunter_won: bool
+    duration: float
+    catches: List[Tuple[float, int]] = field(default_factory=list)  # (time, cursor id)
+    crossings: int = 0
+    boosts: int = 0
+    freezes: int = 0
+    shuffles: int = 0
+
+
+class Cursor:
+    __slots__ = ("id", "pi", "x", "y", "size", "step", "alive", "boost_until", "freeze_until", "direction")
+
+    def __init__(self, cid: int, size: int, step: int, x: int, y: int):
+        self.id = cid
+        self.pi = cid  # 最初は自分の Pi にいる
+        self.x = x
+        self.y = y
+        self.size = size
+        self.step = step
+        self.alive = True
+        self.boost_until = 0.0
+        self.freeze_until = 0.0
+        self.direction = None
+
+
+class Game:
+    """One game on a virtual clock; every random choice comes from ``seed``."""
+
+    def __init__(self, config: GameConfig, seed: int):
+        self.config = config
+        self.seed = seed
+        self.rng = random.Random(seed)
+        self.t = 0.0
+        self.ticks = 0
+        n = len(config.cursor_sizes)
+        self.layout = list(range(n))  # [top-left, top-right, bottom-left, bottom-right]
+        self.adj = compute_adj_from_layout(self.layout)
+        self.cursors = [
+            Cursor(cid, config.cursor_sizes[cid], config.move_steps[cid], *config.start) for cid in range(n)
+        ]
+        self.hunter = self.cursors[config.hunter_id]
+        self.purple: Optional[Tuple[int, int, int]] = None  # (pi, x, y)
+        self.next_purple = config.purple_interval
+        self.lock_until = 0.0
+        self.runners_left = n - 1
+        self.result = GameResult(seed, False, 0.0)
+
+    def run(self) -> GameResult:
+        config = self.config
+        while self.t < config.time_limit:
+            self.step()
+            if not self.runners_left:
+                self.result.hunter_won = True
+                break
+            # 加算を繰り返すと誤差が溜まるので tick 数から求める（87 * 0.2 = 17.400000000000002 になる分も丸める）
+            self.ticks += 1
+            self.t = round(self.ticks * config.tick, 9)
+        self.result.duration = min(self.t, config.time_limit)
+        return self.result
+
+    def step(self):
+        """Advance one tick: purple spawn, shuffle button, then every cursor's move."""
+        config = self.config
+        rng = self.rng
+        t = self.t
+
+        if t >= self.next_purple:
+            self.next_purple += config.purple_interval
+            if self.purple is None:
+                alive = [c.id for c in self.cursors if c.alive]
+                self.purple = (rng.choice(alive), rng.randint(0, WIDTH - 1), rng.randint(0, HEIGHT - 1))
+
+        if t < self.lock_until:
+            return
+        if config.shuffle_rate and len(self.layout) > 1 and rng.random() < config.shuffle_rate * config.tick:
+            self.shuffle()
+            return
+
+        # プレイヤーの傾き: move_prob で傾け、turn_prob で方向を変える
+        rand = rng.random
+        move_prob = config.move_prob
+        turn_prob = config.turn_prob
+        for cursor in self.cursors:
+            if not cursor.alive or cursor.freeze_until > t or rand() >= move_prob:
+                continue
+            direction = cursor.direction
+            if direction is None or rand() < turn_prob:
+                direction = cursor.direction = DIRECTIONS[int(rand() * 4)]
+            self.move(cursor, direction)
+
+    def shuffle(self):
+        original = self.layout[:]
+        while self.layout == original:
+            self.rng.shuffle(self.layout)
+        self.adj = compute_adj_from_layout(self.layout)
+        self.lock_until = self.t + self.config.shuffle_lock
+        self.result.shuffles += 1
+
+    def move(self, cursor: Cursor, direction: str):
+        adj = self.adj.get(cursor.pi, _NO_ADJ)
+        step = cursor.step * 2 if cursor.boost_until > self.t else cursor.step
+        new_x, new_y, crossed = get_new_position(cursor.x, cursor.y, direction, cursor.size, step, adj)
+        if crossed:
+            cursor.pi = get_next_pi(direction, adj)
+            self.result.crossings += 1
+        cursor.x, cursor.y = new_x, new_y
+        self.enter(cursor)
+
+    def enter(self, cursor: Cursor):
+        """cursor_enter: catch check at the entered pixel, then the purple pickup."""
+        hunter = self.hunter
+        pi = cursor.pi
+        purple = self.purple
+        if cursor is not hunter and hunter.pi != pi and (purple is None or purple[0] != pi):
+            return  # 同じ Pi に鬼も紫もいない
+        point = 1 << (cursor.y * WIDTH + cursor.x)
+        if cursor is not hunter:
+            hunter_here = hunter.alive and hunter.pi == pi
+            caught = [cursor] if hunter_here and FOOTPRINTS[hunter.size][hunter.y * WIDTH + hunter.x] & point else []
+        else:
+            caught = [
+                c for c in self.cursors
+                if c.pi == pi and c.alive and c is not hunter and FOOTPRINTS[c.size][c.y * WIDTH + c.x] & point
+            ]
+
+        if (
+            purple is not None
+            and purple[0] == pi
+            and FOOTPRINTS[cursor.size][cursor.y * WIDTH + cursor.x] & (1 << (purple[2] * WIDTH + purple[1]))
+        ):
+            self.purple = None
+            until = self.t + self.config.boost_duration
+            if cursor is hunter:
+                cursor.freeze_until = until
+                self.result.freezes += 1
+            else:
+                cursor.boost_until = until
+                self.result.boosts += 1
+
+        if caught:
+            self.catch(caught)
+
+    def catch(self, caught: Sequence[Cursor]):
+        rng = self.rng
+        for c in caught:
+            if not c.alive:
+                continue
+            c.alive = False
+            self.runners_left -= 1
+            self.result.catches.append((self.t, c.id))
+            if c.id in self.layout:
+                self.layout.remove(c.id)
+        self.adj = compute_adj_from_layout(self.layout)
+
+        # 捕まった Pi は、その上にいる生きているカーソルを生きている Pi のランダムな位置へ飛ばす
+        for c in caught:
+            local = [d for d in self.cursors if d.alive and d.pi == c.id]
+            targets = [d.id for d in self.cursors if d.alive]
+            rng.shuffle(targets)
+            for d, target_pi in zip(local, targets):
+                d.pi = target_pi
+                d.x = random_coordinate(WIDTH - d.size, d.step, rng)
+                d.y = random_coordinate(HEIGHT - d.size, d.step, rng)
+                self.enter(d)
+
+
+def run_batch(config: GameConfig, seeds: Sequence[int]) -> Dict[str, float]:
+    """Play one game per seed and aggregate the outcomes."""
+    results = [Game(config, seed).run() for seed in seeds]
+    won = [r for r in results if r.hunter_won]
+    first_catch = [r.catches[0][0] for r in results if r.catches]
+    games = len(results)
+    return {
+        "games": games,
+        "hunter_win_rate": len(won) / games,
+        "mean_duration": statistics.mean(r.duration for r in results),
+        "mean_win_time": statistics.mean(r.duration for r in won) if won else None,
+        "median_first_catch": statistics.median(first_catch) if first_catch else None,
+        "mean_catches": statistics.mean(len(r.catches) for r in results),
+        "mean_crossings": statistics.mean(r.crossings for r in results),
+        "mean_boosts": statistics.mean(r.boosts for r in results),
+        "mean_freezes": statistics.mean(r.freezes for r in results),
+        "mean_shuffles": statistics.mean(r.shuffles for r in results),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Batch-run seeded games and print outcome stats.")
+    parser.add_argument("--games", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0, help="first seed")
+    defaults = GameConfig()
+    for f in dataclasses.fields(GameConfig):
+        value = getattr(defaults, f.name)
+        if isinstance(value, tuple):
+            parser.add_argument(f"--{f.name.replace('_', '-')}", type=int, nargs="+", default=list(value))
+        else:
+            parser.add_argument(f"--{f.name.replace('_', '-')}", type=type(value), default=value)
+    args = parser.parse_args()
+    config = GameConfig(**{
+        f.name: tuple(getattr(args, f.name)) if isinstance(getattr(defaults, f.name), tuple) else getattr(args, f.name)
+        for f in dataclasses.fields(GameConfig)
+    })
+
+    start = time.perf_counter()
+    summary = run_batch(config, range(args.seed, args.seed + args.games))
+    elapsed = time.perf_counter() - start
+    for key, value in summary.items():
+        print(f"{key:<20}{value if value is None or isinstance(value, int) else round(value, 3)}")
+    print(f"{'games/s':<20}{args.games / elapsed:.0f}")
+
+
+if __name__ == "__main__":
+    main()
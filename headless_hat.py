@@ -0,0 +1,135 @@
+"""Pure-Python, in-memory stand-in for ``sense_hat.SenseHat``.
+
+Implements the subset the node uses (``set_pixel``, ``set_pixels``,
+``get_pixels``, ``clear``, ``show_message``, ``get_accelerometer_raw`` and
+``stick.get_events``) without touching hardware or sense_emu's shared
+memory, so nodes and benchmarks run at full speed on any Linux box.
+
+Sensor input is scripted: set a fixed tilt with :meth:`SenseHat.set_accel`
+or install a function of elapsed time with :meth:`SenseHat.script_accel`,
+and queue joystick events with ``stick.push``.  Display writes are
+counted in ``frame_writes`` / ``pixel_writes``.
+"""
+import random
+import threading
+import time
+from collections import deque, namedtuple
+from typing import Callable, Dict
+
+InputEvent = namedtuple('InputEvent', ('timestamp', 'direction', 'action'))
+
+WIDTH = HEIGHT = 8
+
+
+def _colour(args):
+    if len(args) == 1:
+        args = args[0]
+    if len(args) != 3:
+        raise ValueError('Pixel arguments must be given as (r, g, b) or r, g, b')
+    return [int(c) for c in args]
+
+
+class HeadlessStick:
+    def __init__(self):
+        self._events = deque()
+        self._lock = threading.Lock()
+
+    def push(self, direction: str, action: str = 'pressed'):
+        with self._lock:
+            self._events.append(InputEvent(time.time(), direction, action))
+
+    def get_events(self):
+        with self._lock:
+            events = list(self._events)
+            self._events.clear()
+        return events
+
+
+class SenseHat:
+    def __init__(self):
+        self._pixels = [[0, 0, 0] for _ in range(WIDTH * HEIGHT)]
+        self._accel = {'x': 0.0, 'y': 0.0, 'z': 1.0}
+        self._accel_fn: Callable[[float], Dict[str, float]] = None
+        self._accel_start = time.monotonic()
+        self.stick = HeadlessStick()
+        self.frame_writes = 0
+        self.pixel_writes = 0
+        self.messages = []
+        self.accel_reads = 0
+
+    # --- display ---------------------------------------------------------
+
+    def set_pixel(self, x, y, *args):
+        if not (0 <= x < WIDTH and 0 <= y < HEIGHT):
+            raise ValueError('X and Y position must be between 0 and 7')
+        self._pixels[y * WIDTH + x] = _colour(args)
+        self.pixel_writes += 1
+
+    def get_pixel(self, x, y):
+        return list(self._pixels[y * WIDTH + x])
+
+    def set_pixels(self, pixel_list):
+        if len(pixel_list) != WIDTH * HEIGHT:
+            raise ValueError('Pixel lists must have 64 elements')
+        self._pixels = [_colour((pix,)) for pix in pixel_list]
+        self.frame_writes += 1
+
+    def get_pixels(self):
+        return [list(pix) for pix in self._pixels]
+
+    def clear(self, *args):
+        colour = _colour(args) if args else [0, 0, 0]
+        self.set_pixels([colour] * (WIDTH * HEIGHT))
+
+    def show_message(self, text_string, scroll_speed=.1, text_colour=[255, 255, 255], back_colour=[0, 0, 0]):
+        """Record the message and leave the display blank, without scrolling in real time."""
+        self.messages.append(text_string)
+        self.clear(back_colour)
+
+    # animation.text_frames が使うフォント。実機のフォントは持たないので、
+    # 文字ごとに 4 列の塗りつぶしブロックを返す
+    def _get_char_pixels(self, s):
+        return [[255, 255, 255] if 1 <= k < 7 else [0, 0, 0] for _ in range(4) for k in range(8)]
+
+    def _trim_whitespace(self, char):
+        return char
+
+    # --- sensors ---------------------------------------------------------
+
+    def set_accel(self, x: float, y: float, z: float = 1.0):
+        """Hold a constant accelerometer reading (in g)."""
+        self._accel_fn = None
+        self._accel = {'x': x, 'y': y, 'z': z}
+
+    def script_accel(self, fn: Callable[[float], Dict[str, float]]):
+        """Read the accelerometer from ``fn(seconds since this call)``."""
+        self._accel_start = time.monotonic()
+        self._accel_fn = fn
+
+    def get_accelerometer_raw(self):
+        self.accel_reads += 1
+        if self._accel_fn is not None:
+            return dict(self._accel_fn(time.monotonic() - self._accel_start))
+        return dict(self._accel)
+
+
+TILTS = (
+    {'x': 0.0, 'y': 0.0, 'z': 1.0},
+    {'x': 0.0, 'y': -0.6, 'z': 0.8},  # up
+    {'x': 0.0, 'y': 0.6, 'z': 0.8},   # down
+    {'x': -0.6, 'y': 0.0, 'z': 0.8},  # left
+    {'x': 0.6, 'y': 0.0, 'z': 0.8},   # right
+)
+
+
+def random_tilt(seed: int, hold: float = 0.5) -> Callable[[float], Dict[str, float]]:
+    """Accelerometer script for :meth:`SenseHat.script_accel`.
+
+    Picks a new level or tilted reading every ``hold`` seconds; the
+    choice for each interval depends only on ``seed`` and the interval
+    number, so runs with the same seed tilt the same way.
+    """
+    def read(t: float) -> Dict[str, float]:
+        step = int(t / hold)
+        return TILTS[random.Random(seed * 1000003 + step).randrange(len(TILTS))]
+    return read
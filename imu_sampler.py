@@ -0,0 +1,131 @@
+"""Background accelerometer sampling with a filtered tilt direction.
+
+A daemon thread reads the IMU at ``rate_hz`` into a fixed-size ring
+buffer, smooths x/y/z with an exponential moving average and turns the
+result into a direction with hysteresis: a direction starts when its
+axis passes ``tilt_threshold`` and is held until the axis falls back
+under ``release_threshold``.  Readers only look at :attr:`direction`,
+so they never wait for I2C.
+"""
+import threading
+import time
+from typing import Callable, List, Optional, Tuple
+
+Sample = Tuple[float, float, float, float]  # (monotonic time, x, y, z)
+
+# 方向ごとの「傾きの大きさ」を取り出す (符号, 軸)
+_AXES = {"up": (-1, 1), "down": (1, 1), "left": (-1, 0), "right": (1, 0)}
+
+
+class ImuSampler:
+    def __init__(
+        self,
+        read_fn: Callable[[], dict],
+        rate_hz: float = 100.0,
+        buffer_size: int = 256,
+        alpha: float = 0.07,
+        tilt_threshold: float = 0.3,
+        release_threshold: float = 0.2,
+    ):
+        self.read_fn = read_fn
+        self.period = 1.0 / rate_hz
+        self.alpha = alpha
+        self.tilt_threshold = tilt_threshold
+        self.release_threshold = release_threshold
+        self._buf: List[Optional[Sample]] = [None] * buffer_size
+        self._head = 0
+        self.count = 0
+        self.last_sample_at: Optional[float] = None  # 最新サンプルの monotonic 時刻
+        self.filtered = (0.0, 0.0, 1.0)  # 最初の z は重力方向なので 1.0
+        self.direction: Optional[str] = None
+        # 方向が変わった時にサンプラスレッドから呼ばれる (時刻, 新しい方向)
+        self.on_change: Callable[[float, Optional[str]], None] = None
+        self.changes = 0
+        self.errors = 0
+        self.max_read_time = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+        self._started_at = None
+
+    def start(self):
+        self._stop.clear()
+        self._started_at = time.monotonic()
+        self._thread = threading.Thread(target=self._run, name="imu-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        deadline = time.monotonic()
+        while not self._stop.is_set():
+            start = time.monotonic()
+            try:
+                accel = self.read_fn()
+            except OSError:
+                self.errors += 1
+            else:
+                self.max_read_time = max(self.max_read_time, time.monotonic() - start)
+                self.add_sample(start, accel['x'], accel['y'], accel['z'])
+            deadline += self.period
+            delay = deadline - time.monotonic()
+            if delay < 0:
+                deadline = time.monotonic()  # 遅れた分は取り戻さない
+            else:
+                self._stop.wait(delay)
+
+    def add_sample(self, t: float, x: float, y: float, z: float):
+        """Store one raw sample and update the filter and direction."""
+        self._buf[self._head] = (t, x, y, z)
+        self._head = (self._head + 1) % len(self._buf)
+        self.count += 1
+        self.last_sample_at = t
+
+        fx, fy, fz = self.filtered
+        a = self.alpha
+        fx += a * (x - fx)
+        fy += a * (y - fy)
+        fz += a * (z - fz)
+        self.filtered = (fx, fy, fz)
+
+        direction = self._classify(fx, fy)
+        if direction != self.direction:
+            self.direction = direction
+            self.changes += 1
+            if self.on_change is not None:
+                self.on_change(t, direction)
+
+    def _classify(self, x: float, y: float) -> Optional[str]:
+        if self.direction is not None:
+            sign, axis = _AXES[self.direction]
+            if sign * (x, y)[axis] > self.release_threshold:
+                return self.direction
+        threshold = self.tilt_threshold
+        if y < -threshold:
+            return "up"
+        elif y > threshold:
+            return "down"
+        elif x < -threshold:
+            return "left"
+        elif x > threshold:
+            return "right"
+        return None
+
+    def snapshot(self, n: Optional[int] = None) -> List[Sample]:
+        """The latest ``n`` raw samples (all buffered ones by default), oldest first."""
+        head = self._head
+        samples = [s for s in self._buf[head:] + self._buf[:head] if s is not None]
+        return samples if n is None else samples[-n:]
+
+    def stats(self):
+        elapsed = time.monotonic() - self._started_at if self._started_at else 0.0
+        return {
+            "samples": self.count,
+            "rate": self.count / elapsed if elapsed else 0.0,
+            "changes": self.changes,
+            "errors": self.errors,
+            "max_read_time": self.max_read_time,
+        }
@@ -0,0 +1,60 @@
+from bisect import insort
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from collision import footprint_mask
+
+
+class OccupancyGrid:
+    """Which cursors cover each pixel of one board.
+
+    Every cell keeps the ids of the cursors covering it sorted by
+    priority, so the cursor to display at a pixel is simply the first
+    entry.  Cursors are added with :meth:`place` when they enter the board
+    (or move on it) and dropped with :meth:`remove` when they leave.
+    """
+
+    def __init__(self, width: int, height: int, priority: Sequence[int]):
+        self.width = width
+        self.height = height
+        self.rank = {cid: i for i, cid in enumerate(priority)}
+        self.cells: List[List[Tuple[int, int]]] = [[] for _ in range(width * height)]
+        # cursor id -> (x, y, size)
+        self.footprints: Dict[int, Tuple[int, int, int]] = {}
+        # cursor id -> 64 bit の footprint マスク（collision.py）
+        self.masks: Dict[int, int] = {}
+
+    def _indices(self, x: int, y: int, size: int):
+        for dy in range(size):
+            if 0 <= y + dy < self.height:
+                row = (y + dy) * self.width
+                for dx in range(size):
+                    if 0 <= x + dx < self.width:
+                        yield row + x + dx
+
+    def place(self, cid: int, x: int, y: int, size: int) -> Optional[Tuple[int, int, int]]:
+        """Put ``cid`` at (x, y); returns its previous footprint, if any."""
+        old = self.remove(cid)
+        entry = (self.rank.get(cid, len(self.rank)), cid)
+        for idx in self._indices(x, y, size):
+            insort(self.cells[idx], entry)
+        self.footprints[cid] = (x, y, size)
+        self.masks[cid] = footprint_mask(x, y, size)
+        return old
+
+    def remove(self, cid: int) -> Optional[Tuple[int, int, int]]:
+        """Take ``cid`` off the board; returns the footprint it had."""
+        old = self.footprints.pop(cid, None)
+        self.masks.pop(cid, None)
+        if old is not None:
+            entry = (self.rank.get(cid, len(self.rank)), cid)
+            for idx in self._indices(*old):
+                self.cells[idx].remove(entry)
+        return old
+
+    def ids_at(self, x: int, y: int) -> List[int]:
+        """Cursor ids covering (x, y), highest priority first."""
+        return [cid for _, cid in self.cells[y * self.width + x]]
+
+    def top_at(self, x: int, y: int) -> Optional[int]:
+        cell = self.cells[y * self.width + x]
+        return cell[0][1] if cell else None
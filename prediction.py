@@ -0,0 +1,76 @@
+from collections import OrderedDict
+from typing import Callable, Hashable, Tuple
+
+# (pi, x, y): カーソルがいる Pi とその Pi 上の座標
+CursorState = Tuple[int, int, int]
+
+
+class CursorPredictor:
+    """Shadow position of a cursor that is hosted on another Pi.
+
+    Every MOVE sent to the host is applied locally with ``step_fn`` and
+    remembered under its move sequence number.  When the host confirms a
+    sequence number with its authoritative state, the prediction is either
+    counted as a hit or the shadow is rebased on the confirmed state and
+    the still unconfirmed moves are replayed on top of it.
+    """
+
+    def __init__(self, step_fn: Callable[[CursorState, Hashable], CursorState], max_pending: int = 64):
+        self.step_fn = step_fn
+        self.max_pending = max_pending
+        self.shadow: CursorState = None
+        self.pending: "OrderedDict[int, Tuple[Hashable, CursorState]]" = OrderedDict()
+        self.seq = 0
+        self.predictions = 0
+        self.hits = 0
+        self.corrections = 0
+        self.stale = 0
+
+    def reset(self, state: CursorState):
+        """Start predicting from a known authoritative state."""
+        self.shadow = state
+        self.pending.clear()
+
+    def predict(self, direction) -> int:
+        """Apply ``direction`` to the shadow and return the move sequence number."""
+        self.seq = (self.seq + 1) % (1 << 16)
+        self.shadow = self.step_fn(self.shadow, direction)
+        self.pending[self.seq] = (direction, self.shadow)
+        if len(self.pending) > self.max_pending:
+            self.pending.popitem(last=False)
+        self.predictions += 1
+        return self.seq
+
+    def confirm(self, seq: int, state: CursorState) -> bool:
+        """Reconcile with the host's state after move ``seq``; True on a hit."""
+        if seq not in self.pending:
+            # 既に確定済み、または古すぎる確認
+            self.stale += 1
+            return False
+        # seq までの（失われた分も含む）予測を捨てる
+        while True:
+            done_seq, (_, predicted) = self.pending.popitem(last=False)
+            if done_seq == seq:
+                break
+        if predicted == state:
+            self.hits += 1
+            return True
+
+        self.corrections += 1
+        shadow = state
+        for later_seq, (direction, _) in list(self.pending.items()):
+            shadow = self.step_fn(shadow, direction)
+            self.pending[later_seq] = (direction, shadow)
+        self.shadow = shadow
+        return False
+
+    def metrics(self):
+        confirmed = self.hits + self.corrections
+        return {
+            "predictions": self.predictions,
+            "hits": self.hits,
+            "corrections": self.corrections,
+            "stale_confirms": self.stale,
+            "pending": len(self.pending),
+            "hit_rate": self.hits / confirmed if confirmed else 0.0,
+        }
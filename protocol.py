@@ -0,0 +1,155 @@
+"""Binary wire format for the commands exchanged between the Pis.
+
+Every datagram starts with a fixed 5 byte header::
+
+    version (u8) | opcode (u8) | sender id (u8) | sequence (u16)
+
+followed by an opcode specific payload.  Fixed payloads are a ``struct``;
+list payloads (CATCH, SHUFFLE, ACK) are written as ``"<prefix>*<element>"``:
+optional fixed prefix fields, a count byte, then that many elements.
+Timestamps are cluster time in seconds (see clock_sync.py).
+
+Messages of a traced move (see trace_report.py) set the ``TRACED`` bit of
+the opcode byte and carry a u32 trace id between the header and the
+payload; untraced messages have no trace id on the wire.
+"""
+import struct
+from typing import NamedTuple, Tuple
+
+PROTOCOL_VERSION = 3
+
+HEADER = struct.Struct("!BBBH")
+# opcode バイトの最上位ビット: ヘッダの後に trace id (u32) が続く
+TRACED = 0x80
+TRACE_ID = "I"
+
+# opcodes
+MOVE = 1
+DRAW = 2
+CROSS = 3
+CATCH = 4
+SHUFFLE = 5
+PURPLE = 6
+BOOST = 7
+FREEZE = 8
+CHECK = 9
+LOCATE = 10
+CONFIRM = 11
+ACK = 12
+MOVETO = 13
+TIME_REQ = 14
+TIME_RESP = 15
+
+# MOVE の方向は adj と同じ並び (up, right, down, left) のインデックスで送る
+DIRECTIONS = ("up", "right", "down", "left")
+
+# opcode -> (name, payload)。payload は struct か "<prefix>*<element>" 形式のリスト
+OPCODES = {
+    MOVE: ("MOVE", struct.Struct("!BBH")),       # direction, cursor_id, move_seq
+    DRAW: ("DRAW", struct.Struct("!BBBB")),      # x, y, pi, cursor_id
+    CROSS: ("CROSS", struct.Struct("!BBBB")),    # next_pi, x, y, cursor_id
+    CATCH: ("CATCH", "*B"),                      # caught ids
+    SHUFFLE: ("SHUFFLE", "d*B"),                 # lock_until, new layout
+    PURPLE: ("PURPLE", struct.Struct("!BBB")),   # target_pi, x, y
+    BOOST: ("BOOST", struct.Struct("!Bd")),      # cursor_id, until
+    FREEZE: ("FREEZE", struct.Struct("!Bd")),    # cursor_id, until
+    CHECK: ("CHECK", struct.Struct("!BBBB")),    # x, y, pi, cursor_id
+    LOCATE: ("LOCATE", struct.Struct("!BB")),    # cursor_id, host pi
+    CONFIRM: ("CONFIRM", struct.Struct("!BHBBB")),  # cursor_id, move_seq, pi, x, y
+    ACK: ("ACK", "*H"),                          # acknowledged sequence numbers
+    MOVETO: ("MOVETO", struct.Struct("!BHBBB")),  # cursor_id, move_seq, pi, x, y
+    TIME_REQ: ("TIME_REQ", struct.Struct("!d")),  # t0
+    TIME_RESP: ("TIME_RESP", struct.Struct("!ddd")),  # t0, t1, t2
+}
+
+SEQ_MOD = 1 << 16
+_SEQ_MASK = SEQ_MOD - 1
+
+# opcode バイト（TRACED ビット込み）-> ヘッダ (+ trace id) と合わせて 1 回で pack/unpack する struct
+_FRAMES = {}
+# リスト型: opcode バイト -> (ヘッダ + prefix + count の struct, prefix の個数, 要素の配列の struct)
+_LISTS = {}
+# 要素の型 -> 要素数ごとの struct（count は 1 バイトなので 256 通り）
+_ARRAYS = {}
+for _opcode, (_, _payload) in OPCODES.items():
+    for _byte, _head in ((_opcode, HEADER.format), (_opcode | TRACED, HEADER.format + TRACE_ID)):
+        if isinstance(_payload, struct.Struct):
+            _FRAMES[_byte] = struct.Struct(_head + _payload.format[1:])
+        else:
+            _prefix, _, _element = _payload.partition("*")
+            if _element not in _ARRAYS:
+                _ARRAYS[_element] = [struct.Struct(f"!{n}{_element}") for n in range(256)]
+            # prefix は 1 文字 1 フィールドで書く
+            _LISTS[_byte] = (struct.Struct(_head + _prefix + "B"), len(_prefix), _ARRAYS[_element])
+
+
+class ProtocolError(ValueError):
+    """Raised when a datagram cannot be decoded."""
+
+
+class Message(NamedTuple):
+    opcode: int
+    sender: int
+    seq: int
+    fields: Tuple[int, ...]
+    trace: int = 0
+
+
+# NamedTuple のコンストラクタは Python の関数呼び出しになるので、受信側は tuple.__new__ で直接作る
+_new_message = tuple.__new__
+
+
+def encode(opcode: int, sender: int, seq: int, fields=(), trace: int = 0) -> bytes:
+    """Pack a command into its binary representation."""
+    if not trace:
+        frame = _FRAMES.get(opcode)
+        if frame is not None:
+            return frame.pack(PROTOCOL_VERSION, opcode, sender, seq & _SEQ_MASK, *fields)
+        header = (PROTOCOL_VERSION, opcode, sender, seq & _SEQ_MASK)
+    else:
+        header = (PROTOCOL_VERSION, opcode | TRACED, sender, seq & _SEQ_MASK, trace)
+        frame = _FRAMES.get(header[1])
+        if frame is not None:
+            return frame.pack(*header, *fields)
+    if header[1] not in _LISTS:
+        raise ProtocolError(f"unknown opcode {opcode}")
+    head, n_prefix, arrays = _LISTS[header[1]]
+    count = len(fields) - n_prefix
+    return head.pack(*header, *fields[:n_prefix], count) + arrays[count].pack(*fields[n_prefix:])
+
+
+def decode(data: bytes) -> Message:
+    """Unpack a datagram produced by :func:`encode`."""
+    if len(data) < HEADER.size:
+        raise ProtocolError(f"short datagram ({len(data)} bytes)")
+    if data[0] != PROTOCOL_VERSION:
+        raise ProtocolError(f"unsupported protocol version {data[0]}")
+    byte = data[1]
+    frame = _FRAMES.get(byte)
+    if frame is not None:
+        if len(data) != frame.size:
+            raise ProtocolError(f"bad payload length for {opcode_name(byte & ~TRACED)}")
+        # ヘッダとペイロードを 1 回で unpack し、フィールドはその後ろをスライスするだけ
+        values = frame.unpack(data)
+        if byte & TRACED:
+            return _new_message(Message, (byte & ~TRACED, values[2], values[3], values[5:], values[4]))
+        return _new_message(Message, (byte, values[2], values[3], values[4:], 0))
+    opcode = byte & ~TRACED
+    if byte not in _LISTS:
+        raise ProtocolError(f"unknown opcode {opcode}")
+    head, _, arrays = _LISTS[byte]
+    if len(data) < head.size:
+        raise ProtocolError(f"missing list for {opcode_name(opcode)}")
+    values = head.unpack_from(data)
+    array = arrays[values[-1]]
+    if len(data) != head.size + array.size:
+        raise ProtocolError(f"bad list length for {opcode_name(opcode)}")
+    # trace id があればヘッダの 4 フィールドの後ろ
+    if byte & TRACED:
+        return _new_message(Message, (opcode, values[2], values[3], values[5:-1] + array.unpack_from(data, head.size), values[4]))
+    return _new_message(Message, (opcode, values[2], values[3], values[4:-1] + array.unpack_from(data, head.size), 0))
+
+
+def opcode_name(opcode: int) -> str:
+    entry = OPCODES.get(opcode)
+    return entry[0] if entry else f"OP{opcode}"
@@ -0,0 +1,90 @@
+import asyncio
+import heapq
+import itertools
+import time
+from typing import Dict, Iterable
+
+
+class PriorityReceiveQueue:
+    """Received commands ordered by opcode priority, then arrival order.
+
+    ``priorities`` maps opcode -> priority (lower runs first).  Commands for
+    which only the newest one per cursor matters (``latest_only``) are
+    dropped when a newer one for the same cursor has been queued, and
+    commands listed in ``stale_after`` are dropped once they waited longer
+    than the given number of seconds.
+    """
+
+    def __init__(self, priorities: Dict[int, int], default_priority: int,
+                 latest_only: Dict[int, int] = None, stale_after: Dict[int, float] = None):
+        self.priorities = priorities
+        self.default_priority = default_priority
+        # opcode -> fields 中のカーソル id の位置
+        self.latest_only = latest_only or {}
+        self.stale_after = stale_after or {}
+        self._heap = []
+        self._order = itertools.count()
+        self._latest: Dict[tuple, int] = {}
+        # get() を待っているコルーチンを起こすイベント（ループ上で遅延生成）
+        self._ready = None
+        self.max_depth = 0
+        # opcode -> [処理数, 破棄数, 待ち時間合計, 最大待ち時間]
+        self._wait: Dict[int, list] = {}
+
+    def __len__(self):
+        return len(self._heap)
+
+    def put(self, msg, addr_port, data: bytes):
+        order = next(self._order)
+        key_index = self.latest_only.get(msg.opcode)
+        if key_index is not None:
+            self._latest[(msg.opcode, msg.fields[key_index])] = order
+        priority = self.priorities.get(msg.opcode, self.default_priority)
+        heapq.heappush(self._heap, (priority, order, time.monotonic(), msg, addr_port, data))
+        self.max_depth = max(self.max_depth, len(self._heap))
+        if self._ready is not None:
+            self._ready.set()
+
+    async def get(self):
+        """Return the next ``(msg, addr_port, data)`` that is still worth handling (data: the datagram as received)."""
+        while True:
+            while not self._heap:
+                if self._ready is None:
+                    self._ready = asyncio.Event()
+                self._ready.clear()
+                await self._ready.wait()
+            _, order, queued_at, msg, addr_port, data = heapq.heappop(self._heap)
+            waited = time.monotonic() - queued_at
+            entry = self._wait.setdefault(msg.opcode, [0, 0, 0.0, 0.0])
+            if self._is_stale(msg, order, waited):
+                entry[1] += 1
+                continue
+            entry[0] += 1
+            entry[2] += waited
+            entry[3] = max(entry[3], waited)
+            return msg, addr_port, data
+
+    def _is_stale(self, msg, order, waited) -> bool:
+        key_index = self.latest_only.get(msg.opcode)
+        if key_index is not None and self._latest.get((msg.opcode, msg.fields[key_index])) != order:
+            return True
+        limit = self.stale_after.get(msg.opcode)
+        return limit is not None and waited > limit
+
+    def stats(self, name_fn=str) -> Dict[str, object]:
+        """Queue depth and per-opcode wait times (seconds)."""
+        per_opcode = {}
+        # メトリクスのスクレイプは別スレッドから呼ぶので、先に list で写してから回す
+        for opcode, (handled, dropped, total, worst) in list(self._wait.items()):
+            per_opcode[name_fn(opcode)] = {
+                "handled": handled,
+                "dropped": dropped,
+                "avg_wait": total / handled if handled else 0.0,
+                "max_wait": worst,
+            }
+        return {"depth": len(self._heap), "max_depth": self.max_depth, "opcodes": per_opcode}
+
+
+def priority_table(groups: Iterable[Iterable[int]]) -> Dict[int, int]:
+    """Build an opcode -> priority map from groups listed highest first."""
+    return {opcode: level for level, group in enumerate(groups) for opcode in group}
@@ -0,0 +1,159 @@
+"""Retransmission, selective ACK and duplicate suppression for critical commands.
+
+Only the opcodes the node registers as reliable go through this layer;
+everything else (MOVE in particular) stays plain fire-and-forget UDP.
+The header sequence number of each datagram identifies it: the receiver
+acknowledges exactly the sequence numbers it got (selective ACK) and the
+sender retransmits whatever is still unacknowledged when its RTO expires.
+"""
+import asyncio
+import time
+from collections import deque
+from typing import Callable, Dict, Optional, Tuple
+
+import protocol
+
+# ACK 1 個に載せる最大のシーケンス番号数（count は u8）
+MAX_ACK_BATCH = 255
+
+
+class RtoEstimator:
+    """Retransmission timeout per destination (RFC 6298 style SRTT/RTTVAR)."""
+
+    def __init__(self, initial: float = 0.2, min_rto: float = 0.05, max_rto: float = 2.0):
+        self.srtt = None
+        self.rttvar = None
+        self.rto = initial
+        self.min_rto = min_rto
+        self.max_rto = max_rto
+
+    def sample(self, rtt: float):
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            self.rttvar = 0.75 * self.rttvar + 0.25 * abs(self.srtt - rtt)
+            self.srtt = 0.875 * self.srtt + 0.125 * rtt
+        self.rto = min(self.max_rto, max(self.min_rto, self.srtt + 4 * self.rttvar))
+
+
+class _Pending:
+    __slots__ = ("data", "first_sent", "retries", "rto", "timer")
+
+    def __init__(self, data: bytes, first_sent: float, rto: float):
+        self.data = data
+        self.first_sent = first_sent
+        self.retries = 0
+        # 再送ごとに倍にする（宛先の推定値とは別に持つ）
+        self.rto = rto
+        self.timer = None
+
+
+class ReliableChannel:
+    """Reliability sublayer on top of a plain datagram send function.
+
+    ``send_fn(data, dst_addr)`` puts a datagram on the wire.  The caller
+    reports every reliable datagram it sends with :meth:`track`, every
+    reliable datagram it receives with :meth:`accept` and every ACK with
+    :meth:`on_ack`.  ``on_give_up(seq, dst_addr)`` is called when a
+    datagram is dropped after ``max_retries`` retransmissions.
+    """
+
+    def __init__(self, node_id: int, send_fn: Callable[[bytes, str], None],
+                 max_retries: int = 8, dedup_window: int = 256,
+                 on_give_up: Optional[Callable[[int, str], None]] = None):
+        self.node_id = node_id
+        self.send_fn = send_fn
+        self.on_give_up = on_give_up
+        self.max_retries = max_retries
+        self.dedup_window = dedup_window
+        self.pending: Dict[Tuple[str, int], _Pending] = {}
+        self.rto: Dict[str, RtoEstimator] = {}
+        # 送信元ごとに最近受け取ったシーケンス番号
+        self._seen: Dict[int, Tuple[set, deque]] = {}
+        # まとめて送る ACK（宛先 -> seq のリスト）
+        self._acks: Dict[str, list] = {}
+        self._ack_scheduled = False
+        self.stats = {"sent": 0, "retransmits": 0, "acked": 0, "gave_up": 0,
+                      "duplicates": 0, "acks_sent": 0}
+
+    # --- 送信側 ---
+    def track(self, data: bytes, seq: int, dst_addr: str):
+        """Start retransmitting ``data`` to ``dst_addr`` until ``seq`` is acked."""
+        entry = _Pending(data, time.monotonic(), self._estimator(dst_addr).rto)
+        self.pending[(dst_addr, seq)] = entry
+        self.stats["sent"] += 1
+        self._arm(dst_addr, seq, entry)
+
+    def _estimator(self, dst_addr: str) -> RtoEstimator:
+        est = self.rto.get(dst_addr)
+        if est is None:
+            est = self.rto[dst_addr] = RtoEstimator()
+        return est
+
+    def _arm(self, dst_addr: str, seq: int, entry: _Pending):
+        loop = asyncio.get_running_loop()
+        entry.timer = loop.call_later(entry.rto, self._expire, dst_addr, seq)
+
+    def _expire(self, dst_addr: str, seq: int):
+        entry = self.pending.get((dst_addr, seq))
+        if entry is None:
+            return
+        if entry.retries >= self.max_retries:
+            del self.pending[(dst_addr, seq)]
+            self.stats["gave_up"] += 1
+            if self.on_give_up is not None:
+                self.on_give_up(seq, dst_addr)
+            return
+        entry.retries += 1
+        self.stats["retransmits"] += 1
+        entry.rto = min(self._estimator(dst_addr).max_rto, entry.rto * 2)
+        self.send_fn(entry.data, dst_addr)
+        self._arm(dst_addr, seq, entry)
+
+    def on_ack(self, seqs, src_addr: str):
+        for seq in seqs:
+            entry = self.pending.pop((src_addr, seq), None)
+            if entry is None:
+                continue
+            entry.timer.cancel()
+            self.stats["acked"] += 1
+            # Karn: 再送したものは RTT の計測に使わない
+            if entry.retries == 0:
+                self._estimator(src_addr).sample(time.monotonic() - entry.first_sent)
+
+    # --- 受信側 ---
+    def accept(self, sender: int, seq: int, src_addr: str) -> bool:
+        """ACK a reliable datagram; False if it was already delivered."""
+        self._queue_ack(seq, src_addr)
+        seen, order = self._seen.setdefault(sender, (set(), deque()))
+        if seq in seen:
+            self.stats["duplicates"] += 1
+            return False
+        seen.add(seq)
+        order.append(seq)
+        if len(order) > self.dedup_window:
+            seen.discard(order.popleft())
+        return True
+
+    def _queue_ack(self, seq: int, src_addr: str):
+        self._acks.setdefault(src_addr, []).append(seq)
+        if not self._ack_scheduled:
+            # 同じループ周回で受け取った分を 1 個の ACK にまとめる
+            self._ack_scheduled = True
+            asyncio.get_running_loop().call_soon(self._flush_acks)
+
+    def _flush_acks(self):
+        self._ack_scheduled = False
+        acks, self._acks = self._acks, {}
+        for dst_addr, seqs in acks.items():
+            for i in range(0, len(seqs), MAX_ACK_BATCH):
+                data = protocol.encode(protocol.ACK, self.node_id, 0, seqs[i:i + MAX_ACK_BATCH])
+                self.send_fn(data, dst_addr)
+                self.stats["acks_sent"] += 1
+
+    def close(self):
+        for entry in self.pending.values():
+            if entry.timer is not None:
+                entry.timer.cancel()
+        self.pending.clear()
@@ -0,0 +1,269 @@
+"""Replay recorded node sessions through the game logic of test_com_v7.py.
+
+Every node writes ``sessions/node<N>-<time>.ses`` (see session.py).  For
+each session a worker process imports ``test_com_v7`` against the
+headless display, with the recorded seed and a virtual clock, and feeds
+the recorded inputs -- tick directions, button reads, dispatched
+commands, animation ticks, purple spawns, the timeout -- to the same
+functions the event loop would call.  Commands the replay sends are
+captured instead of going on the network.
+
+The replay is compared with the recording as it goes: every sent
+command (opcode, fields, destinations) and every LED frame (crc32).
+Reconstructed frames are written to ``<out-dir>/<session>.frames.jsonl``
+and the divergences to ``<out-dir>/<session>.report.json``.
+
+Usage: python replay.py SESSION [SESSION ...] [--out-dir DIR] [--speed X]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from collections import deque
+
+import session
+from session import read_session
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+# 記録したアドレスの代わりに使うループバックアドレス（simulate.py と重ならないように）
+REPLAY_NET = "127.0.30"
+# レポートに残す食い違いの最大数
+MAX_DIVERGENCES = 50
+# 時刻のフィールド（BOOST の終了時刻など）は tick 内の経過時間の分だけずれてよい
+TIME_TOLERANCE = 0.01
+
+
+def same_send(a, b) -> bool:
+    (op_a, fields_a, ids_a), (op_b, fields_b, ids_b) = a, b
+    if op_a != op_b or ids_a != ids_b or len(fields_a) != len(fields_b):
+        return False
+    for x, y in zip(fields_a, fields_b):
+        if isinstance(x, float) or isinstance(y, float):
+            if abs(x - y) > TIME_TOLERANCE:
+                return False
+        elif x != y:
+            return False
+    return True
+
+
+class VirtualTime:
+    """Stands in for the ``time`` module: monotonic and wall time follow the records."""
+
+    def __init__(self, wall_minus_mono: float):
+        self.wall_minus_mono = wall_minus_mono
+        self.now = 0.0  # 記録と同じ monotonic 時刻
+
+    def time(self):
+        return self.now + self.wall_minus_mono
+
+    def monotonic(self):
+        return self.now
+
+    def __getattr__(self, name):
+        return getattr(time, name)  # perf_counter, strftime ... は本物
+
+
+class Replayer:
+    def __init__(self, node, header, records, frames_file):
+        self.node = node
+        self.records = records
+        self.pos = 0
+        self.frames_file = frames_file
+        self.t0 = records[0].t if records else 0.0
+        self.sent = deque()  # 再生中に送られた (opcode, fields, 宛先 id)
+        self.divergences = []
+        self.diverged = 0
+        self.frames = 0
+        self.frames_matched = 0
+        self.sends_matched = 0
+
+    def diverge(self, t, what, expected, got):
+        self.diverged += 1
+        if len(self.divergences) < MAX_DIVERGENCES:
+            self.divergences.append({"t": round(t - self.t0, 6), "what": what, "expected": expected, "got": got})
+
+    # --- test_com_v7 の関数の差し替え ---
+    def capture_send(self, opcode, fields, dst_addrs):
+        ids = tuple(self.node.addr_to_id.get(addr, self.node.UNKNOWN_NODE) for addr in dst_addrs)
+        self.sent.append((opcode, tuple(fields), ids))
+
+    def take_input(self, kind, default):
+        """Return the recorded value of the next input read by the game logic."""
+        if self.pos < len(self.records) and self.records[self.pos].kind == kind:
+            record = self.records[self.pos]
+            self.pos += 1
+            self.node.time.now = record.t
+            return record.value
+        self.diverge(self.node.time.now, "input", session.KIND_NAMES[kind], None)
+        return default
+
+    def install(self):
+        node = self.node
+        node.send_message = lambda opcode, fields, dst_addr: self.capture_send(opcode, fields, [dst_addr])
+        node.send_many = lambda opcode, fields, dst_addrs: self.capture_send(opcode, fields, dst_addrs)
+        node.get_direction = lambda: self.take_input(session.DIRECTION, None)
+        node.check_shuffle_button = lambda: self.take_input(session.BUTTON, False)
+
+    # --- 再生 ---
+    def run(self, speed=0.0):
+        node = self.node
+        started = time.monotonic()
+        node.draw_initial_frame()
+        while self.pos < len(self.records):
+            record = self.records[self.pos]
+            self.pos += 1
+            if speed:
+                delay = (record.t - self.t0) / speed - (time.monotonic() - started)
+                if delay > 0:
+                    time.sleep(delay)
+            node.time.now = record.t
+            kind = record.kind
+            if kind == session.TICK:
+                node.game_tick()
+            elif kind == session.DISPATCH:
+                if node.dispatch(*record.value):
+                    # show_caught と同じく CAUGHT! を流してから消す
+                    node.animator.cancel()
+                    node.animator.play(node.CAUGHT_FRAMES, node.fb.clear)
+            elif kind == session.SEND:
+                self.check_send(record)
+            elif kind == session.FRAME:
+                self.check_frame(record)
+            elif kind == session.ANIMATION:
+                node.animator.tick(record.t)
+            elif kind == session.SPAWN:
+                node.spawn_purple()
+            elif kind == session.TIMEOUT:
+                node.timeout_handler()
+            elif kind == session.CLOCK:
+                node.clock.offset = record.value
+            else:
+                # tick の外で記録された入力（再生側が読まなかった）
+                self.diverge(record.t, "unused input", session.KIND_NAMES[kind], None)
+        for opcode, fields, ids in self.sent:
+            self.diverge(node.time.now, "extra send", None, self.describe(opcode, fields, ids))
+
+    def describe(self, opcode, fields, ids):
+        return f"{self.node.protocol.opcode_name(opcode)} {list(fields)} -> {list(ids)}"
+
+    def check_send(self, record):
+        msg, ids = record.value
+        expected = (msg.opcode, tuple(msg.fields), ids)
+        if not self.sent:
+            self.diverge(record.t, "missing send", self.describe(*expected), None)
+            return
+        got = self.sent.popleft()
+        if same_send(got, expected):
+            self.sends_matched += 1
+        else:
+            self.diverge(record.t, "send", self.describe(*expected), self.describe(*got))
+
+    def check_frame(self, record):
+        node = self.node
+        node.flush_frame()
+        crc = session.frame_crc(node.fb.pixels)
+        match = crc == record.value
+        self.frames += 1
+        self.frames_matched += match
+        if not match:
+            self.diverge(record.t, "frame", record.value, crc)
+        pixels = bytes(c for pixel in node.fb.pixels for c in pixel).hex()
+        self.frames_file.write(json.dumps({"t": round(record.t - self.t0, 6), "match": match, "pixels": pixels}) + "\n")
+
+    def report(self, path, header):
+        return {
+            "session": path,
+            "node": header["node"],
+            "records": len(self.records),
+            "duration": round(self.records[-1].t - self.t0, 3) if self.records else 0.0,
+            "frames": self.frames,
+            "frames_matched": self.frames_matched,
+            "sends_matched": self.sends_matched,
+            "divergences": self.diverged,
+            "first_divergences": self.divergences,
+        }
+
+
+def output_path(out_dir, path, suffix):
+    return os.path.join(out_dir, os.path.splitext(os.path.basename(path))[0] + suffix)
+
+
+def run_worker(path, out_dir, speed):
+    """Replay one session in this process (test_com_v7 can only be imported once)."""
+    header, records = read_session(path)
+    node_id = header["node"]
+    os.environ.update(
+        SENSE_BACKEND="headless",
+        NODE_ADDRS=",".join(f"{REPLAY_NET}.{i + 1}" for i in range(header["nodes"])),
+        NODE_TIME_SCALE=repr(header["time_scale"]),
+        NODE_SEED=str(header["seed"]),
+        NODE_TRACE_SAMPLE=repr(header["trace_sample"]),
+        NODE_SESSION_DIR="",
+        NODE_METRICS_PORT="0",
+        NODE_RECORDER_DIR=os.path.join(out_dir, "flight"),
+    )
+    os.environ.pop("SIM_TILT_SEED", None)
+    sys.argv = [os.path.join(HERE, "test_com_v7.py"), str(node_id)]
+    sys.path.insert(0, HERE)
+    import clock_sync
+    import test_com_v7 as node
+
+    vt = VirtualTime(header["wall_minus_mono"])
+    node.time = vt
+    clock_sync.time = vt
+    node.transport.close()  # 再生中は送らない
+
+    with open(output_path(out_dir, path, ".frames.jsonl"), "w") as frames_file:
+        replayer = Replayer(node, header, records, frames_file)
+        replayer.install()
+        replayer.run(speed)
+    report = replayer.report(path, header)
+    with open(output_path(out_dir, path, ".report.json"), "w") as f:
+        json.dump(report, f, indent=2)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("sessions", nargs="+")
+    parser.add_argument("--out-dir", default="replay_out")
+    parser.add_argument("--speed", type=float, default=0.0, help="replay this many times faster than recorded (0: as fast as possible)")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    # ワーカーは HERE で動くので、相対パスはここで絶対パスにしておく
+    args.sessions = [os.path.abspath(path) for path in args.sessions]
+    args.out_dir = os.path.abspath(args.out_dir)
+    os.makedirs(args.out_dir, exist_ok=True)
+
+    if args.worker:
+        run_worker(args.sessions[0], args.out_dir, args.speed)
+        return
+
+    # ノードごとに別プロセスで並行に再生する
+    procs = []
+    for path in args.sessions:
+        cmd = [sys.executable, os.path.abspath(__file__), path, "--worker", "--out-dir", args.out_dir, "--speed", str(args.speed)]
+        procs.append((path, subprocess.Popen(cmd, cwd=HERE, stdout=subprocess.DEVNULL)))
+
+    failed = False
+    print(f"{'node':<6}{'records':>9}{'secs':>8}{'frames':>13}{'sends':>7}{'diverged':>10}  session")
+    for path, proc in procs:
+        if proc.wait() != 0:
+            print(f"{'?':<6}{'replay failed':>47}  {path}")
+            failed = True
+            continue
+        with open(output_path(args.out_dir, path, ".report.json")) as f:
+            r = json.load(f)
+        frames = f"{r['frames_matched']}/{r['frames']}"
+        print(f"{r['node']:<6}{r['records']:>9}{r['duration']:>8.1f}{frames:>13}{r['sends_matched']:>7}{r['divergences']:>10}  {path}")
+        if r["first_divergences"]:
+            first = r["first_divergences"][0]
+            print(f"      first divergence at {first['t']:.3f}s: {first['what']} expected={first['expected']} got={first['got']}")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""Compact binary session log of one node, for replay.py.
+
+Layout::
+
+    b"GSES1\\n"  !I header length  JSON header  records...
+
+Every record is ``!dBH`` (``time.monotonic()``, kind, payload length)
+followed by the payload; the header has ``wall_minus_mono`` to get back
+to ``time.time()``.  Inputs to the game logic are recorded in the order the
+node consumed them, expected outputs (sent commands, LED frames) at the
+moment they were produced:
+
+    TICK       game_tick() starts
+    DIRECTION  get_direction() result (index in protocol.DIRECTIONS, 255 = none)
+    BUTTON     check_shuffle_button() result
+    DISPATCH   command taken from the receive queue (protocol datagram)
+    SEND       command sent: destination count, node ids, datagram
+    FRAME      frame written to the LED matrix (crc32 of the RGB bytes)
+    ANIMATION  the animator ticked
+    SPAWN      purple_spawn_loop woke up
+    TIMEOUT    the time limit expired
+    CLOCK      new cluster clock offset
+"""
+import json
+import struct
+import zlib
+from typing import List, NamedTuple, Optional, Sequence, Tuple
+
+import protocol
+
+MAGIC = b"GSES1\n"
+_LENGTH = struct.Struct("!I")
+_RECORD = struct.Struct("!dBH")
+_BYTE = struct.Struct("!B")
+_CRC = struct.Struct("!I")
+_OFFSET = struct.Struct("!d")
+
+TICK, DIRECTION, BUTTON, DISPATCH, SEND, FRAME, ANIMATION, SPAWN, TIMEOUT, CLOCK = range(1, 11)
+KIND_NAMES = {
+    TICK: "TICK", DIRECTION: "DIRECTION", BUTTON: "BUTTON", DISPATCH: "DISPATCH", SEND: "SEND",
+    FRAME: "FRAME", ANIMATION: "ANIMATION", SPAWN: "SPAWN", TIMEOUT: "TIMEOUT", CLOCK: "CLOCK",
+}
+NO_DIRECTION = 255
+
+
+def frame_crc(pixels: Sequence[Sequence[int]]) -> int:
+    return zlib.crc32(bytes(c for pixel in pixels for c in pixel))
+
+
+class SessionWriter:
+    """Append records to ``path``; every method is a no-op when ``path`` is None."""
+
+    def __init__(self, path: Optional[str], header: dict, clock):
+        self.path = path
+        # 記録時刻の時計（time.monotonic）
+        self.clock = clock
+        self.records = 0
+        self._file = None
+        if path is not None:
+            self._file = open(path, "wb", buffering=1 << 16)
+            data = json.dumps(header).encode()
+            self._file.write(MAGIC + _LENGTH.pack(len(data)) + data)
+
+    def _record(self, kind: int, payload: bytes = b"", t: Optional[float] = None):
+        if self._file is None:
+            return
+        self._file.write(_RECORD.pack(self.clock() if t is None else t, kind, len(payload)) + payload)
+        self.records += 1
+
+    def tick(self, t: float):
+        # tick の中の判定はこの時刻を使うので、再生でも同じ値になるように渡してもらう
+        self._record(TICK, t=t)
+
+    def direction(self, direction: Optional[str]):
+        if self._file is not None:
+            index = NO_DIRECTION if direction is None else protocol.DIRECTIONS.index(direction)
+            self._record(DIRECTION, _BYTE.pack(index))
+
+    def button(self, pressed: bool):
+        self._record(BUTTON, _BYTE.pack(pressed))
+
+    def dispatch(self, datagram: bytes):
+        self._record(DISPATCH, datagram)
+
+    def send(self, datagram: bytes, dst_ids: Sequence[int]):
+        self._record(SEND, bytes([len(dst_ids), *dst_ids]) + datagram)
+
+    def frame(self, pixels):
+        if self._file is not None:
+            self._record(FRAME, _CRC.pack(frame_crc(pixels)))
+
+    def animation(self):
+        self._record(ANIMATION)
+
+    def spawn(self):
+        self._record(SPAWN)
+
+    def timeout(self):
+        self._record(TIMEOUT)
+
+    def clock_offset(self, offset: float):
+        self._record(CLOCK, _OFFSET.pack(offset))
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class Record(NamedTuple):
+    t: float
+    kind: int
+    value: object
+
+
+def _decode(kind: int, payload: bytes):
+    if kind == DIRECTION:
+        return None if payload[0] == NO_DIRECTION else protocol.DIRECTIONS[payload[0]]
+    if kind == BUTTON:
+        return bool(payload[0])
+    if kind == DISPATCH:
+        return protocol.decode(payload), payload
+    if kind == SEND:
+        count = payload[0]
+        return protocol.decode(payload[1 + count:]), tuple(payload[1:1 + count])
+    if kind == FRAME:
+        return _CRC.unpack(payload)[0]
+    if kind == CLOCK:
+        return _OFFSET.unpack(payload)[0]
+    return None
+
+
+def read_session(path: str) -> Tuple[dict, List[Record]]:
+    with open(path, "rb") as f:
+        data = f.read()
+    if not data.startswith(MAGIC):
+        raise ValueError(f"{path} is not a session file")
+    pos = len(MAGIC)
+    (length,) = _LENGTH.unpack_from(data, pos)
+    pos += _LENGTH.size
+    header = json.loads(data[pos:pos + length])
+    pos += length
+    records = []
+    while pos + _RECORD.size <= len(data):
+        t, kind, size = _RECORD.unpack_from(data, pos)
+        pos += _RECORD.size
+        if pos + size > len(data):
+            break  # 書き込み途中で止まった最後のレコード
+        records.append(Record(t, kind, _decode(kind, data[pos:pos + size])))
+        pos += size
+    return header, records
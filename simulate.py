@@ -0,0 +1,166 @@
+"""Run the four-Pi cluster on one Linux machine.
+
+Starts one ``test_com_v7.py`` process per node with the headless
+display, each bound to its own loopback address (127.0.10.1, .2, ...;
+every 127/8 address is local on Linux, so no setup is needed) and fed
+random tilts.  The nodes run with NODE_LOG_LEVEL=debug, so their event
+log (see event_log.py) has a ``send``/``recv`` record for every message;
+pairing them by the node-side timestamps gives per-opcode delivery
+latency.  DRAW is the crossing of a cursor to the next Pi.  With
+``--trace RATE`` that fraction of moves is traced from the IMU sample to
+the LED (see trace_report.py) and the per-hop breakdown is printed too.
+
+Usage: python simulate.py [--nodes N] [--duration SECS] [--speed X] [--seed S] [--trace RATE] [--log-dir DIR]
+"""
+import argparse
+import json
+import os
+import re
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict, deque
+
+import trace_report
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+NODE_SCRIPT = os.path.join(HERE, "test_com_v7.py")
+MAX_NODES = 4  # devices テーブルの台数
+
+# 各ノードが終了時に出す統計行
+STATS_RE = re.compile(r"^\[(LOG|PREDICT|RELIABLE|TRANSPORT|RECV QUEUE|CLOCK|FRAME|HAT|TICK|IMU|ANIMATION)\] ")
+
+
+def node_addrs(n):
+    return [f"127.0.10.{i + 1}" for i in range(n)]
+
+
+def start_node(node_id, addrs, speed, seed, trace, out_dir):
+    env = dict(os.environ)
+    env.update(
+        SENSE_BACKEND="headless",
+        NODE_ADDRS=",".join(addrs),
+        NODE_TIME_SCALE=str(speed),
+        SIM_TILT_SEED=str(seed * 100 + node_id),
+        NODE_LOG_LEVEL="debug",
+        NODE_TRACE_SAMPLE=str(trace),
+        NODE_RECORDER_DIR=os.path.join(out_dir, "flight"),
+        NODE_SESSION_DIR=os.path.join(out_dir, "sessions"),
+        PYTHONUNBUFFERED="1",
+    )
+    return subprocess.Popen(
+        [sys.executable, NODE_SCRIPT, str(node_id)],
+        cwd=HERE,
+        env=env,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        text=True,
+    )
+
+
+def collect(proc, lines):
+    for line in proc.stdout:
+        lines.append(line.rstrip("\n"))
+
+
+def events(lines, name):
+    """Yield the node's event log records called ``name``."""
+    for line in lines:
+        if line.startswith("{"):
+            record = json.loads(line)
+            if record["event"] == name:
+                yield record
+
+
+def delivery_latencies(outputs, addrs):
+    """Pair each unicast ``send`` with the matching ``recv`` at its destination."""
+    # 全ノード同じマシンなので、ノード側の時刻をそのまま比較できる
+    sent = defaultdict(deque)  # (op, fields, src, dst) -> send times
+    for node_id, lines in outputs.items():
+        for e in events(lines, "send"):
+            if isinstance(e["dst"], str):
+                sent[(e["op"], str(e["fields"]), addrs[node_id], e["dst"])].append(e["t"])
+    latencies = defaultdict(list)  # opcode name -> seconds
+    for node_id, lines in outputs.items():
+        for e in events(lines, "recv"):
+            pending = sent.get((e["op"], str(e["fields"]), e["src"], addrs[node_id]))
+            if pending:
+                latencies[e["op"]].append(e["t"] - pending.popleft())
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--nodes", type=int, default=MAX_NODES)
+    parser.add_argument("--duration", type=float, default=20.0, help="wall-clock seconds")
+    parser.add_argument("--speed", type=float, default=1.0, help="game time runs this many times faster")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--trace", type=float, default=0.0, help="fraction of moves to trace end to end")
+    parser.add_argument("--log-dir", help="write each node's output to DIR/node<N>.log")
+    args = parser.parse_args()
+    if not 1 <= args.nodes <= MAX_NODES:
+        parser.error(f"--nodes must be between 1 and {MAX_NODES}")
+
+    addrs = node_addrs(args.nodes)
+    # フライトレコーダとセッションの記録は作業ディレクトリに散らかさない
+    out_dir = args.log_dir or tempfile.mkdtemp(prefix="simulate-")
+    procs, outputs, readers = {}, {}, []
+    for node_id in range(args.nodes):
+        procs[node_id] = start_node(node_id, addrs, args.speed, args.seed, args.trace, out_dir)
+        outputs[node_id] = []
+        reader = threading.Thread(target=collect, args=(procs[node_id], outputs[node_id]), daemon=True)
+        reader.start()
+        readers.append(reader)
+
+    deadline = time.monotonic() + args.duration
+    while time.monotonic() < deadline and any(p.poll() is None for p in procs.values()):
+        time.sleep(0.1)
+    for proc in procs.values():
+        if proc.poll() is None:
+            proc.send_signal(signal.SIGINT)
+    for proc in procs.values():
+        try:
+            proc.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+    for reader in readers:
+        reader.join(timeout=1)
+
+    if args.log_dir:
+        os.makedirs(args.log_dir, exist_ok=True)
+        for node_id, lines in outputs.items():
+            with open(os.path.join(args.log_dir, f"node{node_id}.log"), "w") as f:
+                f.writelines(line + "\n" for line in lines)
+
+    print(f"{args.nodes} nodes, {args.duration:.1f}s wall clock at {args.speed:g}x")
+    print(f"flight records and sessions (replay.py) in {out_dir}")
+    for node_id, lines in outputs.items():
+        sends = sum(1 for _ in events(lines, "send"))
+        received = sum(1 for _ in events(lines, "recv"))
+        print(f"\n--- node {node_id} ({addrs[node_id]}): exit={procs[node_id].returncode} sent={sends} received={received}")
+        for line in lines:
+            if STATS_RE.match(line):
+                print(f"  {line}")
+
+    latencies = delivery_latencies(outputs, addrs)
+    print(f"\n{'opcode':<10}{'count':>7}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}")
+    for name, values in sorted(latencies.items()):
+        values.sort()
+        p95 = values[min(len(values) - 1, int(len(values) * 0.95))]
+        print(f"{name:<10}{len(values):>7}{statistics.median(values) * 1000:>10.2f}"
+              f"{p95 * 1000:>10.2f}{values[-1] * 1000:>10.2f}")
+    if "DRAW" not in latencies:
+        print("(no crossings in this run)")
+
+    if args.trace:
+        traces = trace_report.read_spans(line for lines in outputs.values() for line in lines)
+        print()
+        trace_report.print_report(trace_report.hop_latencies(traces), len(traces))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""Parameter sweeps over the game rules on every core.
+
+Runs game_core games for each point of the grid
+PURPLE_INTERVAL x BOOST_DURATION x move_step x cursor_size (hunter and
+runners separately) on a ProcessPoolExecutor.  Every finished chunk of
+games is appended to ``<out>.ckpt`` right away, so an interrupted sweep
+picks up where it stopped when started again with the same arguments.
+At the end all games are written, one row each, to the columnar file
+``<out>`` (see columnar.py) and a per-point summary is printed.
+
+Usage: python sweep.py --out sweep.gcol [--games N] [--chunk N] [--workers N]
+           [--purple-interval S ...] [--boost-duration S ...]
+           [--hunter-step N ...] [--hunter-size N ...] [--runner-step N ...] [--runner-size N ...]
+"""
+import argparse
+import itertools
+import json
+import os
+import signal
+import statistics
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from columnar import write_columns
+from game_core import Game, GameConfig
+
+PARAMS = ("purple_interval", "boost_duration", "hunter_step", "hunter_size", "runner_step", "runner_size")
+OUTCOMES = ("seed", "hunter_won", "duration", "first_catch", "catches", "crossings", "boosts", "freezes")
+
+
+def config_for(point) -> GameConfig:
+    p = dict(zip(PARAMS, point))
+    return GameConfig(
+        purple_interval=p["purple_interval"],
+        boost_duration=p["boost_duration"],
+        cursor_sizes=(p["hunter_size"],) + (p["runner_size"],) * 3,
+        move_steps=(p["hunter_step"],) + (p["runner_step"],) * 3,
+    )
+
+
+def ignore_sigint():
+    # Ctrl-C はプロセスグループ全体に届く。中断は親が行い、実行中の chunk は最後まで走らせる
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def run_chunk(point, seeds):
+    """Worker: play ``seeds`` at one grid point; returns the outcome columns."""
+    config = config_for(point)
+    rows = {name: [] for name in OUTCOMES}
+    for seed in seeds:
+        r = Game(config, seed).run()
+        rows["seed"].append(seed)
+        rows["hunter_won"].append(r.hunter_won)
+        rows["duration"].append(r.duration)
+        rows["first_catch"].append(r.catches[0][0] if r.catches else None)
+        rows["catches"].append(len(r.catches))
+        rows["crossings"].append(r.crossings)
+        rows["boosts"].append(r.boosts)
+        rows["freezes"].append(r.freezes)
+    return rows
+
+
+def load_checkpoint(path):
+    done = {}
+    if not os.path.exists(path):
+        return done
+    with open(path) as f:
+        lines = f.readlines()
+    valid = []
+    for line in lines:
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            continue  # 書き込み途中で止まった行
+        point, start, stop = entry["key"]
+        done[(tuple(point), start, stop)] = entry["rows"]
+        valid.append(line if line.endswith("\n") else line + "\n")
+    if valid != lines:
+        # 壊れた行の後ろに追記すると次の記録も読めなくなるので、読めた記録だけで書き直す
+        with open(path + ".tmp", "w") as f:
+            f.writelines(valid)
+        os.replace(path + ".tmp", path)
+    return done
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sweep game rule parameters across all cores.")
+    parser.add_argument("--out", required=True, help="columnar output file")
+    parser.add_argument("--games", type=int, default=1000, help="games per grid point")
+    parser.add_argument("--chunk", type=int, default=250, help="games per task")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--seed", type=int, default=0, help="first seed (same seeds at every point)")
+    defaults = GameConfig()
+    parser.add_argument("--purple-interval", type=float, nargs="+", default=[defaults.purple_interval])
+    parser.add_argument("--boost-duration", type=float, nargs="+", default=[defaults.boost_duration])
+    parser.add_argument("--hunter-step", type=int, nargs="+", default=[defaults.move_steps[0]])
+    parser.add_argument("--hunter-size", type=int, nargs="+", default=[defaults.cursor_sizes[0]])
+    parser.add_argument("--runner-step", type=int, nargs="+", default=[defaults.move_steps[1]])
+    parser.add_argument("--runner-size", type=int, nargs="+", default=[defaults.cursor_sizes[1]])
+    args = parser.parse_args()
+
+    grid = list(itertools.product(*(getattr(args, name) for name in PARAMS)))
+    tasks = []
+    for point in grid:
+        for start in range(args.seed, args.seed + args.games, args.chunk):
+            tasks.append((point, start, min(start + args.chunk, args.seed + args.games)))
+
+    checkpoint_path = args.out + ".ckpt"
+    done = load_checkpoint(checkpoint_path)
+    pending = [task for task in tasks if task not in done]
+    print(f"{len(grid)} grid points, {len(tasks)} tasks, {len(tasks) - len(pending)} already done")
+
+    if pending:
+        with open(checkpoint_path, "a") as ckpt, ProcessPoolExecutor(args.workers, initializer=ignore_sigint) as pool:
+            futures = {pool.submit(run_chunk, point, range(start, stop)): (point, start, stop)
+                       for point, start, stop in pending}
+            try:
+                for i, future in enumerate(as_completed(futures), 1):
+                    key = futures[future]
+                    rows = future.result()
+                    done[key] = rows
+                    ckpt.write(json.dumps({"key": key, "rows": rows}) + "\n")
+                    ckpt.flush()
+                    print(f"\r{i}/{len(pending)} tasks", end="", flush=True)
+            except KeyboardInterrupt:
+                print(f"\ninterrupted; run again with the same arguments to resume from {checkpoint_path}")
+                pool.shutdown(cancel_futures=True)
+                sys.exit(1)
+        print()
+
+    columns = {name: [] for name in PARAMS + OUTCOMES}
+    for task in tasks:
+        rows = done[task]
+        n = len(rows["seed"])
+        for name, value in zip(PARAMS, task[0]):
+            columns[name].extend([value] * n)
+        for name in OUTCOMES:
+            columns[name].extend(rows[name])
+    write_columns(args.out, columns)
+    print(f"wrote {len(columns['seed'])} games to {args.out}")
+
+    print(" ".join(f"{name:>15}" for name in PARAMS) + f"{'win rate':>10}{'duration':>10}{'catches':>9}")
+    for point in grid:
+        rows = [done[task] for task in tasks if task[0] == point]
+        won = [w for r in rows for w in r["hunter_won"]]
+        duration = [d for r in rows for d in r["duration"]]
+        catches = [c for r in rows for c in r["catches"]]
+        print(" ".join(f"{value:>15g}" for value in point)
+              + f"{sum(won) / len(won):>10.3f}{statistics.mean(duration):>10.1f}{statistics.mean(catches):>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,153 @@
-try:
-    from sense_hat import SenseHat  # real hardware
-except Exception:  # fallback for environments without RTIMU
-    from sense_emu import SenseHat
+import os
+import sys
+
+# --headless か SENSE_BACKEND=headless でハードウェアなしのインメモリ実装を使う
+HEADLESS = os.environ.get("SENSE_BACKEND") == "headless"
+if "--headless" in sys.argv:
+    sys.argv.remove("--headless")
+    HEADLESS = True
+if HEADLESS:
+    from headless_hat import SenseHat
+else:
+    try:
+        from sense_hat import SenseHat  # real hardware
+    except Exception:  # fallback for environments without RTIMU
+        from sense_emu import SenseHat
 from dataclasses import dataclass
 from typing import List, Tuple, Dict
-import sys
 import time
-import socket
-import threading
+import asyncio
 import random
+import signal
+import traceback
+
+import protocol
+from animation import Animator, still, text_frames
+from event_log import DEBUG, LEVELS, EventLog
+from flight_recorder import FlightRecorder
+from framebuffer import FrameBuffer
+from game_core import compute_adj_from_layout, get_new_position, get_next_pi, random_coordinate
+from imu_sampler import ImuSampler
+import metrics
+from occupancy import OccupancyGrid
+from clock_sync import ClockSync
+from collision import covering, pixel_bit
+from prediction import CursorPredictor
+from recv_queue import PriorityReceiveQueue, priority_table
+from reliable import ReliableChannel
+from session import SessionWriter
+from tick import TickScheduler
+from transport import UdpTransport
 
 sense = SenseHat()
 
+# 移動や送受信ごとの出力は JSON Lines のイベントログに書き、書き込みは別スレッドで行う。
+# NODE_LOG_LEVEL=debug で移動・送受信の 1 件ごとのイベントも出す
+log = EventLog(level=LEVELS[os.environ.get("NODE_LOG_LEVEL", "info")])
+
+# 乱数の種はセッションに記録し、replay.py で同じ乱数列を使う
+SEED = int(os.environ.get("NODE_SEED") or random.SystemRandom().randrange(1 << 32))
+random.seed(SEED)
+
+# 計測値は http://<自分のアドレス>:NODE_METRICS_PORT/metrics で Prometheus 形式で読める（0 で無効）
+METRICS_PORT = int(os.environ.get("NODE_METRICS_PORT", "9100"))
+registry = metrics.Registry()
+messages_sent = registry.counter("node_messages_sent_total", "Commands sent, by opcode.", ("op",))
+messages_received = registry.counter("node_messages_received_total", "Datagrams received and decoded, by opcode.", ("op",))
+datagrams_dropped = registry.counter("node_datagrams_dropped_total", "Received datagrams discarded before the queue.", ("reason",))
+handler_seconds = registry.histogram("node_handler_seconds", "Time spent in each command handler.", ("op",))
+handler_errors = registry.counter("node_handler_errors_total", "Commands whose handler raised, by opcode.", ("op",))
+cursor_enter_seconds = registry.histogram("node_cursor_enter_seconds", "Redraw and catch check when a cursor enters a cell.")
+catches_detected = registry.counter("node_catches_detected_total", "Catches detected on this Pi.")
+tick_seconds = registry.histogram("node_tick_seconds", "Game loop work per wake-up (due ticks and frame flush).")
+
+# 傾き→LED の遅延計測: NODE_TRACE_SAMPLE の割合の移動に trace id を付け、
+# 通過した段階ごとに "span" イベント（クラスタ時刻）を出す。集計は trace_report.py
+TRACE_SAMPLE = float(os.environ.get("NODE_TRACE_SAMPLE", "0"))
+# 抽選はゲーム用の乱数列（紫の出現・テレポート・シャッフル）を消費しないよう別の生成器で行う
+trace_random = random.Random(SEED)
+trace_counter = 0
+# いま処理している移動の trace id（0 は追跡しない）。送信するコマンドのヘッダにも載せる
+current_trace = 0
+# cursor_enter まで進み、まだ LED に出ていない trace
+traces_to_flush = set()
+
+def new_trace():
+    global trace_counter
+    if TRACE_SAMPLE <= 0 or trace_random.random() >= TRACE_SAMPLE:
+        return 0
+    trace_counter = trace_counter % 0xFFFFFF + 1
+    return (MY_PI_ID << 24) | trace_counter
+
+def span(trace, stage, at=None):
+    if trace:
+        log.info("span", trace=trace, stage=stage, node=MY_PI_ID, at=clock.now() if at is None else at)
+
+# simulate.py 用: ゲーム内の時間を TIME_SCALE 倍速で進める
+TIME_SCALE = float(os.environ.get("NODE_TIME_SCALE", "1"))
+if HEADLESS and os.environ.get("SIM_TILT_SEED"):
+    from headless_hat import random_tilt
+    sense.script_accel(random_tilt(int(os.environ["SIM_TILT_SEED"]), 0.5 / TIME_SCALE))
+
+# 描画はすべてフレームバッファに書き、LED へは 1 フレームにつき 1 回だけ set_pixels する
+fb = FrameBuffer(sense)
+# フレームの最短間隔（秒）
+FRAME_INTERVAL = 1 / 30
+last_flush = 0.0
+flush_timer = None
+
+def flush_frame():
+    global last_flush, flush_timer
+    if flush_timer is not None:
+        flush_timer.cancel()
+        flush_timer = None
+    last_flush = time.monotonic()
+    if fb.flush():
+        session.frame(fb.pixels)
+    if traces_to_flush:
+        now = clock.now()
+        for trace in traces_to_flush:
+            span(trace, "flush", now)
+        traces_to_flush.clear()
+
+def schedule_flush():
+    """Flush the frame buffer at the next frame boundary."""
+    global flush_timer
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return  # ループ外の描画は呼び出し側で flush する
+    flush_timer = loop.call_later(max(0.0, FRAME_INTERVAL - (time.monotonic() - last_flush)), flush_frame)
+
+fb.on_dirty = schedule_flush
+
+# 数字表示やスクロール文字は事前に作ったフレーム列として再生し、sleep しない
+animator = Animator(fb)
+
+animation_timer = None
+
+def run_animations():
+    global animation_timer
+    animation_timer = None
+    session.animation()
+    delay = animator.tick(time.monotonic())
+    if delay is not None:
+        animation_timer = asyncio.get_running_loop().call_later(delay, run_animations)
+
+def schedule_animation():
+    """Start ticking the animator on the event loop."""
+    global animation_timer
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return
+    # cancel の後に play された場合、前の tick の予約が残っているので置き換える
+    if animation_timer is not None:
+        animation_timer.cancel()
+    animation_timer = loop.call_soon(run_animations)
+
+animator.on_start = schedule_animation
+
 # 色の定義
 RED = [255, 0, 0]
 GREEN = [0, 255, 0]
@@ -20,14 +156,11 @@ YELLOW = [255, 255, 0]
 CLEAR = [0, 0, 0]
 PURPLE = [128, 0, 128]
 
-# 隣接するラズパイが存在しないことを示す値
-NO_NEIGHBOR = 9
-
 WHITE = [255, 255, 255]
 
 # purple event settings
-PURPLE_INTERVAL = 10.0  # seconds between purple spawns
-BOOST_DURATION = 5.0    # seconds of doubled speed
+PURPLE_INTERVAL = 10.0 / TIME_SCALE  # seconds between purple spawns
+BOOST_DURATION = 5.0 / TIME_SCALE    # seconds of doubled speed
 
 digit_patterns = {
     0: [
@@ -72,20 +205,33 @@ digit_patterns = {
     ],
 }
 
-def show_digit(digit: int, duration: float = 1.5):
-    pattern = digit_patterns.get(digit)
-    if pattern:
-        sense.set_pixels(pattern)
-        time.sleep(duration)
-        sense.clear()
+DIGIT_DURATION = 1.5 / TIME_SCALE
+digit_animations = {digit: still(pattern, DIGIT_DURATION) for digit, pattern in digit_patterns.items()}
+
+def show_digit(digit: int, on_done=None):
+    frames = digit_animations.get(digit)
+    if frames:
+        animator.play(frames, on_done)
+
+def show_shuffle_digit(digit: int):
+    """Show the shuffle digit, then redraw the cursors on this Pi."""
+    def done():
+        # redraw cursors after digit display
+        fb.clear()
+        redraw_area(0, 0, max(WIDTH, HEIGHT))
+
+    show_digit(digit, done)
 
 def get_alive_pi_ids() -> List[int]:
     """Return a list of IDs for Pis that are currently marked alive."""
     return [dev.id for dev in devices.values() if dev.alive]
 
 
-def handle_shuffle(new_order: List[int]):
-    """Handle layout shuffling and show a unique identifier for this Pi."""
+def handle_shuffle(new_order: List[int], lock_until: float):
+    """Handle layout shuffling and show a unique identifier for this Pi.
+
+    ``lock_until`` is the cluster time at which normal operation resumes.
+    """
     global layout, operation_lock_until
 
     old_order = layout[:]
@@ -95,7 +241,7 @@ def handle_shuffle(new_order: List[int]):
     for dev_id, adj in compute_adj_from_layout(layout).items():
         devices[dev_id].adj = adj
 
-    operation_lock_until = time.time() + 5
+    operation_lock_until = clock.to_local(lock_until)
 
     # Determine the digits to display.  We use the set of currently alive
     # Pis and shuffle them using a deterministic seed so every Pi computes
@@ -110,12 +256,8 @@ def handle_shuffle(new_order: List[int]):
 
     target_digit = dest_map.get(MY_PI_ID, MY_PI_ID)
 
-    show_digit(target_digit)
-
-    # redraw cursors after digit display
-    for dev in devices.values():
-        if dev.onMyPi:
-            draw_cursor(dev.position[0], dev.position[1], dev.color, dev.cursor_size)
+    # 表示はアニメーションとして積むだけで、受信処理を止めない
+    show_shuffle_digit(target_digit)
 
 # RGB値から変数名を取得する関数
 def get_color_name(rgb):
@@ -149,6 +291,12 @@ devices: Dict[int, DeviceInfo] = {
     3: DeviceInfo(3, "192.168.10.4", YELLOW, [2, 2], (9, 2, 1, 9), False, True, 1, 1),
 }
 
+# NODE_ADDRS="a,b,c,d" で各ラズパイのアドレスを差し替える（simulate.py が 1 台で動かす時に使う）
+NODE_ADDRS = os.environ["NODE_ADDRS"].split(",") if os.environ.get("NODE_ADDRS") else None
+if NODE_ADDRS:
+    for dev, addr in zip(devices.values(), NODE_ADDRS):
+        dev.addr = addr
+
 # 自身のラズパイ（引数にて指定）
 args = sys.argv
 MY_PI_ID = int(args[1])
@@ -174,7 +322,54 @@ addr_to_id = {dev.addr: dev.id for dev in devices.values()}
 # ネットワーク設定
 SRC_PORT = 5005
 DST_PORT = 5005
-BUFFER_SIZE = 1024
+
+# 送受信で共有する常駐ソケット（リスナーもこのソケットで受信する）
+transport = UdpTransport(MY_PI.addr, SRC_PORT)
+
+# 入力（傾き・ボタン・受信コマンド）と出力（送信・フレーム）を記録し、replay.py で再生する。
+# NODE_SESSION_DIR を空にすると記録しない
+SESSION_DIR = os.environ.get("NODE_SESSION_DIR", "sessions")
+# 時刻合わせは再生しないので記録もしない
+UNRECORDED_OPCODES = {protocol.TIME_REQ, protocol.TIME_RESP}
+# devices にないアドレスへの送信は、この id で記録する
+UNKNOWN_NODE = 255
+
+def open_session():
+    if not SESSION_DIR:
+        return SessionWriter(None, {}, time.monotonic)
+    os.makedirs(SESSION_DIR, exist_ok=True)
+    header = {
+        "node": MY_PI_ID,
+        "nodes": len(NODE_ADDRS) if NODE_ADDRS else len(devices),
+        "seed": SEED,
+        "time_scale": TIME_SCALE,
+        "trace_sample": TRACE_SAMPLE,
+        "wall_minus_mono": time.time() - time.monotonic(),
+        "protocol_version": protocol.PROTOCOL_VERSION,
+    }
+    path = os.path.join(SESSION_DIR, f"node{MY_PI_ID}-{time.strftime('%Y%m%d-%H%M%S')}.ses")
+    return SessionWriter(path, header, time.monotonic)
+
+session = open_session()
+
+# 送信シーケンス番号（protocol ヘッダに載せる）
+send_seq = 0
+
+# 取りこぼすと Pi 間で状態がずれるコマンドだけ ACK と再送で確実に届ける
+RELIABLE_OPCODES = {protocol.DRAW, protocol.CROSS, protocol.CATCH, protocol.SHUFFLE, protocol.LOCATE}
+reliable = ReliableChannel(
+    MY_PI_ID,
+    lambda data, addr: transport.sendto(data, addr, DST_PORT),
+    on_give_up=lambda seq, addr: log.warning("reliable_gave_up", seq=seq, dst=addr),
+)
+
+# 全員宛てのコマンドはマルチキャストで 1 回だけ送る（参加できなければユニキャストで全員に送る）
+MULTICAST_GROUP = "239.255.10.1"
+MULTICAST_OPCODES = {protocol.SHUFFLE, protocol.PURPLE, protocol.BOOST, protocol.FREEZE, protocol.CATCH}
+try:
+    transport.join_group(MULTICAST_GROUP, MY_PI.addr)
+except OSError as e:
+    log.warning("multicast_unavailable", error=str(e))
 
 # LEDマトリクスとカーソルの設定
 WIDTH, HEIGHT = 8, 8
@@ -185,44 +380,35 @@ TILT_THRESHOLD = 0.3
 # カーソルの優先順位
 cursor_priority = sorted(devices.keys())
 
+# このPi上のカーソルがどのピクセルを覆っているか（cursor_enter / cursor_leave で更新）
+occupancy = OccupancyGrid(WIDTH, HEIGHT, cursor_priority)
+occupancy.place(MY_PI.id, MY_PI.position[0], MY_PI.position[1], MY_PI.cursor_size)
+
 #鬼のラズパイのID
 HUNTER_ID=0
 
 # --- layout handling ---
 layout = [0, 1, 2, 3]  # [top-left, top-right, bottom-left, bottom-right]
 
-def compute_adj_from_layout(order: List[int]) -> Dict[int, Tuple[int, int, int, int]]:
-    """Compute (up, right, down, left) adjacency from the current layout."""
-
-    # Map layout positions to their neighbour positions on a 2x2 grid
-    mapping = {
-        0: {"up": None, "right": 1, "down": 2, "left": None},
-        1: {"up": None, "right": None, "down": 3, "left": 0},
-        2: {"up": 0, "right": 3, "down": None, "left": None},
-        3: {"up": 1, "right": None, "down": None, "left": 2},
-    }
-
-    padded = order + [NO_NEIGHBOR] * (4 - len(order))
-    result = {}
-
-    for pos, dev_id in enumerate(padded):
-        if dev_id == NO_NEIGHBOR:
-            continue
-        neighbours = mapping[pos]
-        adj = (
-            padded[neighbours["up"]] if neighbours["up"] is not None else NO_NEIGHBOR,
-            padded[neighbours["right"]] if neighbours["right"] is not None else NO_NEIGHBOR,
-            padded[neighbours["down"]] if neighbours["down"] is not None else NO_NEIGHBOR,
-            padded[neighbours["left"]] if neighbours["left"] is not None else NO_NEIGHBOR,
-        )
-        result[dev_id] = adj
-
-    return result
+# 4 台未満で動かす時、アドレスを渡されなかった Pi は最初から抜けた扱いにする
+if NODE_ADDRS:
+    for dev in list(devices.values())[len(NODE_ADDRS):]:
+        dev.alive = False
+        layout.remove(dev.id)
 
 for dev_id, adj in compute_adj_from_layout(layout).items():
     devices[dev_id].adj = adj
 
 operation_lock_until = 0  # when normal operation resumes
+# シャッフル後に操作を止める時間（秒）
+SHUFFLE_LOCK = 5.0 / TIME_SCALE
+
+# 効果の終了時刻はクラスタ時刻で送る。鬼の Pi の時計を基準にする
+clock = ClockSync()
+CLOCK_REFERENCE_ID = HUNTER_ID
+# 時刻合わせの間隔（秒）。起動直後は CLOCK_SYNC_BURST 回だけ短い間隔で測る
+CLOCK_SYNC_INTERVAL = 2.0
+CLOCK_SYNC_BURST = 4
 
 # purple event state
 purple_info = {"pi": None, "pos": (0, 0), "active": False}
@@ -237,17 +423,76 @@ exit_flag = False  # プログラム終了要求フラグ
 # タイムアウトフラグ
 timer_triggered = False
 
+# 直近の送受信・状態の変化・tick の所要時間を固定長のリングバッファに残し、
+# CATCH・ハンドラの例外・制限時間切れ・シグナルの時にファイルへ書き出す
+recorder = FlightRecorder(
+    int(os.environ.get("NODE_RECORDER_SIZE", "4096")),
+    os.environ.get("NODE_RECORDER_DIR", "flight_records"),
+    f"node{MY_PI_ID}",
+)
+# 最後に記録した devices / layout / purple_info
+recorded_state = {}
+
+def record_state():
+    """Record devices, layout and purple_info when they changed since the last call."""
+    for kind, value in (
+        ("devices", tuple((dev.alive, dev.onMyPi, *dev.position) for dev in devices.values())),
+        ("layout", tuple(layout)),
+        ("purple", (purple_info["active"], purple_info["pi"], *purple_info["pos"])),
+    ):
+        if recorded_state.get(kind) != value:
+            recorded_state[kind] = value
+            recorder.record(kind, *value)
+
+def flight_state():
+    # 書き出しは別スレッドなので、変更されうるリストはコピーして渡す
+    return {
+        "devices": {
+            dev.id: {"alive": dev.alive, "on_my_pi": dev.onMyPi, "position": list(dev.position), "adj": list(dev.adj)}
+            for dev in devices.values()
+        },
+        "layout": list(layout),
+        "purple_info": dict(purple_info),
+        "handoff_forward": dict(handoff_forward),
+        "timer_triggered": timer_triggered,
+    }
+
+recorder.state_fn = flight_state
+
 # 制限時間（秒）
-TIME = 180.0
+TIME = 180.0 / TIME_SCALE
 
 # メインループのスリープ間隔（秒）
-TIME_INTERVAL = 0.2
+TIME_INTERVAL = 0.2 / TIME_SCALE
+
+# True: カーソルが出ていくPiが遷移先Piへ直接 DRAW し、持ち主には LOCATE で通知する
+# False: 従来どおり持ち主経由 (CROSS -> DRAW) で遷移する
+HANDOFF_MODE = True
+
+# handoff 済みカーソルの転送先（cursor_id -> pi）。古い MOVE をここへ転送する
+handoff_forward: Dict[int, int] = {}
+
+# True: リモートの自カーソルは方向ではなく予測した絶対位置 (MOVETO) を送る。
+# 送信は MOVE_SEND_INTERVAL ごとに最新の目標 1 個にまとめ、ホストは一番新しいものだけを適用する
+ABSOLUTE_MOVES = True
+MOVE_SEND_INTERVAL = TIME_INTERVAL
+# tick の起床時刻は揺れて間隔が周期より短くなることがあるので、半周期の余裕を見る（新しい目標を 1 tick 遅らせない）
+MOVE_SEND_SLACK = TIME_INTERVAL / 2
+# 確認が返ってこない目標を送り直すまでの時間（秒）
+MOVE_RESEND_INTERVAL = 0.3 / TIME_SCALE
+
+# ホスト側: カーソルごとに最後に適用した MOVETO のシーケンス番号
+last_move_seq: Dict[int, int] = {}
+# 持ち主側: 最後に送った目標
+move_target = {"seq": None, "state": None, "sent_at": 0.0, "trace": 0}
 
 # タイマ（TIME秒後に実行）
 def timeout_handler():
     global timer_triggered
-    print("Triggered")
+    session.timeout()
+    log.info("timeout")
     timer_triggered = True
+    log.info("flight_dump", reason="timeout", path=recorder.dump("timeout"))
 
 
 def isAllDeath():
@@ -260,108 +505,92 @@ def isAllDeath():
     return True
 
 
-# 指定された座標にカーソルを描画する
-def draw_cursor(x, y, color, size):
-    for dx in range(size):
-        for dy in range(size):
-            # 念のため範囲外描画を防ぐ
+def pixel_color(x, y):
+    """Colour to show at (x, y): the purple item, else the top cursor, else CLEAR."""
+    if purple_info["active"] and purple_info["pi"] == MY_PI_ID and tuple(purple_info["pos"]) == (x, y):
+        return PURPLE
+    top = occupancy.top_at(x, y)
+    if top is not None:
+        return devices[top].color
+    return CLEAR
+
+def redraw_area(x, y, size):
+    """Recomposite every pixel of a size x size area from the occupancy index."""
+    if animator.active:
+        return  # アニメーション終了時に全体を描き直す
+    for dy in range(size):
+        for dx in range(size):
             if 0 <= x + dx < WIDTH and 0 <= y + dy < HEIGHT:
-                sense.set_pixel(x + dx, y + dy, color)
-
-# そのピクセルに現在存在するカーソルのリストを取得
-def covers_pixel(dev: "DeviceInfo", x: int, y: int) -> bool:
-    """Return True if the device covers the pixel at (x, y)."""
-    return (
-        dev.position[0] <= x < dev.position[0] + dev.cursor_size
-        and dev.position[1] <= y < dev.position[1] + dev.cursor_size
-    )
-
-
-def get_overlapping_cursors(x, y):
-    print_all_cursor_status()
-    overlapping = []
-    for dev_id in cursor_priority:
-        dev = devices[dev_id]
-        if dev.onMyPi and covers_pixel(dev, x, y):
-            overlapping.append(dev)
-
-    return overlapping
-            
+                fb.set_pixel(x + dx, y + dy, pixel_color(x + dx, y + dy))
 
 # カーソルがあるマスから動いた時に、元居たマスのカーソルを消す
 #（重複判定し、カーソルの移動後のマスに白か、別のカーソルを表示するかも判定）
 def cursor_leave(x, y, target_id):
-    overlapping = get_overlapping_cursors(x, y)
-    overlapping_display = [(dev.id, get_color_name(dev.color)) for dev in overlapping]
-    print(f"[{x},{y}] overlapping: {overlapping_display}")
-    filtered = [dev for dev in overlapping if dev.id != target_id]
-    filtered_display = [(dev.id, get_color_name(dev.color)) for dev in filtered]
-    print(f"[{x},{y}] overlapping: {filtered_display} in cursor_leave target_id={target_id}")
-    if len(filtered) > 0:
-        top = min(filtered, key=lambda d: cursor_priority.index(d.id))
-        draw_cursor(x, y, top.color, top.cursor_size)
-    else:
-        draw_cursor(x, y, CLEAR, devices[target_id].cursor_size)
+    footprint = occupancy.remove(target_id)
+    size = footprint[2] if footprint else devices[target_id].cursor_size
+    if footprint and footprint[:2] != (x, y):
+        redraw_area(*footprint)
+    redraw_area(x, y, size)
+    if log.enabled(DEBUG):
+        log.debug("cursor_leave", cursor=target_id, x=x, y=y, overlapping=occupancy.ids_at(x, y))
 
 # カーソルがあるマスから動いた時に、移動先のカーソルを表示
 #（重複判定し、カーソルの移動後の移動先が自身のカーソルか、別のカーソルを表示するかも判定）
 def cursor_enter(new_x, new_y, color, target_id):
-    overlapping = get_overlapping_cursors(new_x, new_y)
-    overlapping.append(devices[target_id]) #移動先には自カーソルがないので、自カーソルを追加
-    overlapping_display = [(dev.id, get_color_name(dev.color)) for dev in overlapping]
-    print(f"[{new_x},{new_y}] overlapping: {overlapping_display} in cursor_enter")
-
-    top = min(overlapping, key=lambda d: cursor_priority.index(d.id))
-    draw_cursor(new_x, new_y, top.color, top.cursor_size)
-    
-
-    # 捕獲判定
+    started = time.perf_counter()
+    if current_trace:
+        span(current_trace, "enter")
+        traces_to_flush.add(current_trace)
+    size = devices[target_id].cursor_size
+    old = occupancy.place(target_id, new_x, new_y, size)
+    if old is not None and old[:2] != (new_x, new_y):
+        redraw_area(*old)
+    redraw_area(new_x, new_y, size)
+
+    if log.enabled(DEBUG):
+        log.debug("cursor_enter", cursor=target_id, x=new_x, y=new_y, overlapping=occupancy.ids_at(new_x, new_y))
+
+    # 捕獲判定（footprint のビットマスクと移動先 1 ビットの AND）
     res=[] #捕まった逃走者のdeviceリスト
+    point = pixel_bit(new_x, new_y)
     if target_id != HUNTER_ID:
         #注目するカーソル(target_id)が逃走者
         # 鬼でないカーソルが移動してきた場合：そこに鬼がいるか確認
-        hunter_present = any(dev.id == HUNTER_ID for dev in overlapping)
-        print(f"hunter_present = {hunter_present} in side of runner")
+        hunter_present = bool(occupancy.masks.get(HUNTER_ID, 0) & point)
         if hunter_present:
             res = [devices[target_id]]
-        print(f"cursor_enter res = {debug_device_list(res)} in side of runner")
     else:
         #注目するカーソル(target_id)が鬼
         # 鬼が移動してきた場合：そこに逃走者がいるか確認（鬼以外）
-        res = [dev for dev in overlapping if dev.id != HUNTER_ID]
-        print(f"cursor_enter res = {debug_device_list(res)} in side of hunter")
+        res = [devices[cid] for cid in covering(occupancy.masks, new_x, new_y) if cid != HUNTER_ID]
     # 捕獲後の通知
     if len(res)>0:
-        caught_ids = [str(dev.id) for dev in res]
-        message = f"CATCH {len(caught_ids)} " + " ".join(caught_ids)
-        for dev in devices.values():
-            if dev.alive:
-                send_message(message, dev.addr)
+        caught_ids = [dev.id for dev in res]
+        log.info("catch_detected", cursor=target_id, x=new_x, y=new_y, caught=caught_ids)
+        catches_detected.inc()
+        send_many(protocol.CATCH, caught_ids, [dev.addr for dev in devices.values() if dev.alive])
 
     # purple power-up check
     if (
         purple_info["active"]
         and purple_info["pi"] == MY_PI_ID
-        and covers_pixel(devices[target_id], purple_info["pos"][0], purple_info["pos"][1])
+        and target_id in occupancy.ids_at(purple_info["pos"][0], purple_info["pos"][1])
     ):
-        sense.set_pixel(purple_info["pos"][0], purple_info["pos"][1], CLEAR)
         purple_info["active"] = False
+        redraw_area(purple_info["pos"][0], purple_info["pos"][1], 1)
         if target_id == 0:
-            broadcast_message(f"FREEZE {target_id}")
+            broadcast_message(protocol.FREEZE, (target_id, clock.now() + BOOST_DURATION))
         else:
-            broadcast_message(f"BOOST {target_id}")
+            broadcast_message(protocol.BOOST, (target_id, clock.now() + BOOST_DURATION))
+    cursor_enter_seconds.observe(time.perf_counter() - started)
 
                 
 def print_all_cursor_status():
-    print("=== Cursor Status ======================")
+    """Debug dump of every cursor; free when debug logging is off."""
+    if not log.enabled(DEBUG):
+        return
     for dev_id, dev in devices.items():
-        status = "ON" if dev.onMyPi else "OFF"
-        print(f"Pi{dev_id}: pos={dev.position}, onMyPi={status}, {get_color_name(dev.color)}")
-    print("========================================")
-
-def debug_device_list(devices_list):
-    debug_info = [(dev.id, get_color_name(dev.color)) for dev in devices_list]
-    return f"{debug_info}"
+        log.debug("cursor_status", cursor=dev_id, pos=dev.position, on_my_pi=dev.onMyPi, color=get_color_name(dev.color))
 
 # # 加速度センサーの値から傾きの方向を判定する
 # def get_direction():
@@ -388,75 +617,67 @@ def debug_device_list(devices_list):
 #             return "up"
 #     return None
 
-# # ドリフト対策
-# Z_THRESHOLD    = 0.1   # Z 軸（|z|-1g）判定用のしきい値
-# ALPHA          = 0.07   # ローパスフィルタの平滑化係数
-
-# # フィルタ状態を保存する変数（最初の z は重力方向なので 1.0 を初期値に）
-# prev_x, prev_y, prev_z = 0.0, 0.0, 1.0
-
-# def low_pass(raw: float, prev: float) -> float:
-#     """一次 IIR ローパスフィルタ（指数移動平均）"""
-#     return ALPHA * raw + (1 - ALPHA) * prev
-
-# def get_direction():
-#     """
-#     加速度センサーの生データから
-#     ・ローパスフィルタ
-#     ・水平判定 (None)
-#     ・傾き判定 ("up"/"down"/"left"/"right")
-#     を行う
-#     """
-#     global prev_x, prev_y, prev_z
-
-#     # 1) 生データ取得
-#     accel = sense.get_accelerometer_raw()
-#     raw_x, raw_y, raw_z = accel['x'], accel['y'], accel['z']
-
-#     # 2) ローパスフィルタ
-#     x = low_pass(raw_x, prev_x); prev_x = x
-#     y = low_pass(raw_y, prev_y); prev_y = y
-#     z = low_pass(raw_z, prev_z); prev_z = z
-
-#     # 3) 水平判定：X,Y がほぼ 0、Z がほぼ 1g
-#     if abs(x) <= TILT_THRESHOLD and abs(y) <= TILT_THRESHOLD and abs(abs(z) - 1.0) <= Z_THRESHOLD:
-#         return None
-
-#     # 4) 傾き判定
-#     if   y < -TILT_THRESHOLD:
-#         return "up"
-#     elif y >  TILT_THRESHOLD:
-#         return "down"
-#     elif x < -TILT_THRESHOLD:
-#         return "left"
-#     elif x >  TILT_THRESHOLD:
-#         return "right"
+# 加速度センサは別スレッドで高頻度に読み、ローパス + ヒステリシスで方向を決める
+IMU_SAMPLE_HZ = 100 * TIME_SCALE
+ALPHA = 0.07                   # ローパスフィルタの平滑化係数
+TILT_RELEASE_THRESHOLD = 0.2   # 一度傾いた方向はこの値を下回るまで保持する
+imu = ImuSampler(
+    sense.get_accelerometer_raw,
+    IMU_SAMPLE_HZ,
+    alpha=ALPHA,
+    tilt_threshold=TILT_THRESHOLD,
+    release_threshold=TILT_RELEASE_THRESHOLD,
+)
 
-#     return None
 def get_direction():
-    accel = sense.get_accelerometer_raw()  # {'x':…, 'y':…, 'z':…}
-    x = accel['x']
-    y = accel['y']
-    if y < -TILT_THRESHOLD:
-        return "up"
-    elif y > TILT_THRESHOLD:
-        return "down"
-    elif x < -TILT_THRESHOLD:
-        return "left"
-    elif x > TILT_THRESHOLD:
-        return "right"
-    return None
+    """Latest filtered tilt direction; never touches the IMU itself."""
+    direction = imu.direction
+    session.direction(direction)
+    return direction
 
 # 指定されたメッセージを指定された宛先のPiにUDPで送信する
-def send_message(message, dst_addr):
-    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
-        # sock.bind((SRC_ADDR, SRC_PORT))
-        sock.sendto(message.encode(), (dst_addr, DST_PORT))
-        print(f"Send {message} to {dst_addr}")
+def next_seq():
+    global send_seq
+    send_seq = (send_seq + 1) % protocol.SEQ_MOD
+    return send_seq
+
+# 画面に出るまでの経路のコマンドだけ trace id を引き継ぐ
+TRACED_OPCODES = {protocol.MOVE, protocol.MOVETO, protocol.DRAW}
+
+def send_message(opcode, fields, dst_addr):
+    seq = next_seq()
+    trace = current_trace if opcode in TRACED_OPCODES else 0
+    span(trace, "send")
+    data = protocol.encode(opcode, MY_PI_ID, seq, fields, trace)
+    recorder.record("send", opcode, seq, fields, dst_addr)
+    if opcode not in UNRECORDED_OPCODES:
+        session.send(data, (addr_to_id.get(dst_addr, UNKNOWN_NODE),))
+    log.debug("send", op=protocol.opcode_name(opcode), fields=fields, dst=dst_addr)
+    messages_sent.inc(protocol.opcode_name(opcode))
+    transport.sendto(data, dst_addr, DST_PORT)
+    if opcode in RELIABLE_OPCODES:
+        reliable.track(data, seq, dst_addr)
+
+def send_many(opcode, fields, dst_addrs):
+    seq = next_seq()
+    data = protocol.encode(opcode, MY_PI_ID, seq, fields)
+    recorder.record("send", opcode, seq, fields, dst_addrs)
+    session.send(data, [addr_to_id.get(addr, UNKNOWN_NODE) for addr in dst_addrs])
+    messages_sent.inc(protocol.opcode_name(opcode))
+    if opcode in MULTICAST_OPCODES and transport.group is not None:
+        log.debug("send", op=protocol.opcode_name(opcode), fields=fields, dst=transport.group)
+        transport.send_group(data)
+    else:
+        log.debug("send", op=protocol.opcode_name(opcode), fields=fields, dst=dst_addrs)
+        transport.send_many(data, dst_addrs, DST_PORT)
+    # 再送は宛先ごとのユニキャストで行う
+    if opcode in RELIABLE_OPCODES:
+        for addr in dst_addrs:
+            reliable.track(data, seq, addr)
 
-def broadcast_message(message):
-    for dev in devices.values():
-        send_message(message, dev.addr)
+def broadcast_message(opcode, fields):
+    # 捕まった Pi は終了しているので宛先に入れない（SHUFFLE を再送し続けてしまう）
+    send_many(opcode, fields, [dev.addr for dev in devices.values() if dev.alive])
 
 def trigger_shuffle():
     """Shuffle the layout of currently active devices."""
@@ -469,73 +690,14 @@ def trigger_shuffle():
     while new_layout == original:
         random.shuffle(new_layout)
 
-    msg = "SHUFFLE " + ",".join(str(i) for i in new_layout)
-    broadcast_message(msg)
-    handle_shuffle(new_layout)
+    lock_until = clock.now() + SHUFFLE_LOCK
+    broadcast_message(protocol.SHUFFLE, (lock_until, *new_layout))
+    handle_shuffle(new_layout, lock_until)
 
 def check_shuffle_button():
-    for event in sense.stick.get_events():
-        if event.action == 'pressed' and event.direction == 'middle':
-            return True
-    return False
-
-# 移動先の座標を求める & 遷移判定
-def get_new_position(old_x, old_y, direction, size, step, adj):
-    """Return the next position of a cursor and whether it crossed to another Pi."""
-    hasCrossed = False
-
-    # Compute tentative position based on direction and step size
-    new_x, new_y = old_x, old_y
-    if direction == "up":
-        new_y -= step
-    if direction == "down":
-        new_y += step
-    if direction == "left":
-        new_x -= step
-    if direction == "right":
-        new_x += step
-
-    # Vertical bounds
-    if new_y < 0:
-        if adj[0] != NO_NEIGHBOR:
-            new_y = HEIGHT - size
-            hasCrossed = True
-        else:
-            new_y = 0
-    elif new_y > HEIGHT - size:
-        if adj[2] != NO_NEIGHBOR:
-            new_y = 0
-            hasCrossed = True
-        else:
-            new_y = HEIGHT - size
-
-    # Horizontal bounds
-    if new_x < 0:
-        if adj[3] != NO_NEIGHBOR:
-            new_x = WIDTH - size
-            hasCrossed = True
-        else:
-            new_x = 0
-    elif new_x > WIDTH - size:
-        if adj[1] != NO_NEIGHBOR:
-            new_x = 0
-            hasCrossed = True
-        else:
-            new_x = WIDTH - size
-
-    return new_x, new_y, hasCrossed
-
-# 遷移先のPiを求める
-def get_next_pi(direction, adj: Tuple[int, int, int, int]):
-    mapping = {"up": 0, "right": 1, "down": 2, "left": 3}
-    idx = mapping.get(direction)
-    if idx is None:
-        return -1
-    return adj[idx] if adj[idx] != NO_NEIGHBOR else -1
-
-def random_coordinate(max_value, step):
-    values = list(range(0, max_value + 1, step))
-    return random.choice(values)
+    pressed = any(event.action == 'pressed' and event.direction == 'middle' for event in sense.stick.get_events())
+    session.button(pressed)
+    return pressed
 
 def current_move_step(dev_id: int) -> int:
     """Return the move step for the device, applying boost if active."""
@@ -544,289 +706,710 @@ def current_move_step(dev_id: int) -> int:
         return base * 2
     return base
 
-def purple_spawn_loop():
+def predict_step(state, direction):
+    """Predict where a host Pi will put this Pi's cursor after one MOVE."""
+    pi, x, y = state
+    adj = devices[pi].adj
+    new_x, new_y, hasCrossed = get_new_position(
+        x, y, direction, MY_PI.cursor_size, current_move_step(MY_PI.id), adj
+    )
+    if hasCrossed:
+        next_pi = get_next_pi(direction, adj)
+        if next_pi == -1:
+            return state
+        return (next_pi, new_x, new_y)
+    return (pi, new_x, new_y)
+
+# リモートにある自カーソルの予測位置
+predictor = CursorPredictor(predict_step)
+
+def send_move_target(now):
+    """Send the newest predicted position of this Pi's remote cursor (MOVETO)."""
+    global current_trace
+    if not predictor.pending or now - move_target["sent_at"] < MOVE_SEND_INTERVAL - MOVE_SEND_SLACK:
+        return
+    if predictor.shadow == move_target["state"]:
+        # 同じ目標は、確認されないまま MOVE_RESEND_INTERVAL 経った時だけ送り直す
+        if move_target["seq"] not in predictor.pending or now - move_target["sent_at"] < MOVE_RESEND_INTERVAL:
+            return
+    else:
+        move_target["seq"] = predictor.seq
+        move_target["state"] = predictor.shadow
+        # 送信が移動の次の tick になることがあるので、目標を作った移動の trace を載せる
+        current_trace = move_target["trace"]
+    move_target["sent_at"] = now
+    pi, x, y = move_target["state"]
+    send_message(protocol.MOVETO, (MY_PI.id, move_target["seq"], pi, x, y), my_cursor_locator)
+
+def confirm_move(cursor_dev, move_seq, pi, x, y):
+    """Tell the owner where its cursor ended up after MOVE ``move_seq``."""
+    send_message(protocol.CONFIRM, (cursor_dev.id, move_seq, pi, x, y), cursor_dev.addr)
+
+def spawn_purple():
+    """Spawn a purple pixel on a random alive Pi unless one is already out."""
+    if MY_PI_ID != HUNTER_ID:
+        return
+    if purple_info["active"]:
+        return
+    alive = [dev.id for dev in devices.values() if dev.alive]
+    if not alive:
+        return
+    target_pi = random.choice(alive)
+    x = random.randint(0, WIDTH - 1)
+    y = random.randint(0, HEIGHT - 1)
+    broadcast_message(protocol.PURPLE, (target_pi, x, y))
+
+async def purple_spawn_loop():
     """Periodically spawn a purple pixel on a random alive Pi."""
     while True:
-        time.sleep(PURPLE_INTERVAL)
-        if MY_PI_ID != HUNTER_ID:
-            continue
-        if purple_info["active"]:
-            continue
-        alive = [dev.id for dev in devices.values() if dev.alive]
-        if not alive:
-            continue
-        target_pi = random.choice(alive)
-        x = random.randint(0, WIDTH - 1)
-        y = random.randint(0, HEIGHT - 1)
-        broadcast_message(f"PURPLE {target_pi} {x} {y}")
+        await asyncio.sleep(PURPLE_INTERVAL)
+        session.spawn()
+        spawn_purple()
 
-# ネットワークリスナー（サーバプログラム）
-def network_listener():
+# --- 受信コマンドのハンドラ ---
+# 各ハンドラは (fields, sender_id) を受け取る。True を返すとリスナーを終了する。
+
+def accept_hosted_move(opcode, fields, cursor_dev, move_seq):
+    """Common checks for MOVE/MOVETO on the Pi hosting ``cursor_dev``."""
+    cursor_id = cursor_dev.id
+
+    # 自カーソルが手元に戻った後に届いた古い MOVE は捨てる
+    if cursor_id == MY_PI_ID:
+        return False
+
+    if not cursor_dev.onMyPi:
+        # 持ち主がまだ LOCATE を受け取っていない場合は、渡した先へ転送する
+        if HANDOFF_MODE and cursor_id in handoff_forward:
+            send_message(opcode, fields, devices[handoff_forward[cursor_id]].addr)
+        else:
+            log.debug("move_not_hosted", cursor=cursor_id)
+        return False
+
+    if cursor_dev.alive is False:
+        log.debug("move_dead_cursor", cursor=cursor_id)
+        return False
+
+    if freeze_until.get(cursor_id, 0) > time.time():
+        log.debug("move_frozen", cursor=cursor_id)
+        confirm_move(cursor_dev, move_seq, MY_PI_ID, *cursor_dev.position)
+        return False
+    return True
+
+def move_hosted_cursor(cursor_dev, next_pi, new_x, new_y, owner_addr):
+    """Move a cursor hosted on this Pi, handing it over if it left the board."""
+    x, y = cursor_dev.position
+    cursor_id = cursor_dev.id
+    if next_pi == MY_PI_ID:
+        #if is_movable(new_x, new_y): # 重複判定
+        cursor_leave(x, y, cursor_id)
+        cursor_enter(new_x, new_y, cursor_dev.color, cursor_id)
+        cursor_dev.position = [new_x, new_y]
+    elif HANDOFF_MODE:
+        # 遷移先へ直接渡し、持ち主には非同期に居場所を知らせる
+        send_message(protocol.DRAW, (new_x, new_y, cursor_id, cursor_id), devices[next_pi].addr)
+        send_message(protocol.LOCATE, (cursor_id, next_pi), cursor_dev.addr)
+        handoff_forward[cursor_id] = next_pi
+        cursor_dev.onMyPi = False
+        cursor_leave(x, y, cursor_id)
+    else:
+        send_message(protocol.CROSS, (next_pi, new_x, new_y, cursor_id), owner_addr)
+        cursor_dev.onMyPi = False
+        cursor_leave(x, y, cursor_id)
+
+def handle_move(fields, sender_id):
+    direction = protocol.DIRECTIONS[fields[0]]
+    cursor_id = fields[1]
+    move_seq = fields[2]
+
+    # 送信元Pi（操作しているPi）
+    sender = devices[sender_id]
+
+    # 実際に動かすカーソルのデバイス情報
+    cursor_dev = devices[cursor_id]
+
+    if not accept_hosted_move(protocol.MOVE, fields, cursor_dev, move_seq):
+        return
+
+    # カーソルの現在位置
+    x = cursor_dev.position[0]
+    y = cursor_dev.position[1]
+
+    # 移動先座標の計算と遷移判定
+    new_x, new_y, hasCrossed = get_new_position(
+        x,
+        y,
+        direction,
+        cursor_dev.cursor_size,
+        current_move_step(cursor_id),
+        MY_PI.adj,
+    )
+    log.debug("move", cursor=cursor_id, x=x, y=y, new_x=new_x, new_y=new_y)
+
+    next_pi = MY_PI_ID
+    if hasCrossed: # 座標の境界を超える
+        next_pi = get_next_pi(direction, MY_PI.adj)
+        if next_pi == -1:
+            log.debug("move_blocked", cursor=cursor_id, direction=direction)
+            confirm_move(cursor_dev, move_seq, MY_PI_ID, x, y)
+            return  # 無効な移動先なので処理スキップ
+    confirm_move(cursor_dev, move_seq, next_pi, new_x, new_y)
+    move_hosted_cursor(cursor_dev, next_pi, new_x, new_y, sender.addr)
+
+def is_newer_seq(seq, last):
+    """Serial number comparison for u16 sequence numbers."""
+    return last is None or 0 < (seq - last) % protocol.SEQ_MOD < protocol.SEQ_MOD // 2
+
+def handle_moveto(fields, sender_id): # 持ち主が予測した絶対位置への移動
+    cursor_id, move_seq, pi, new_x, new_y = fields
+    cursor_dev = devices[cursor_id]
+
+    # 古い（順番が入れ替わった・再送された）目標は捨てる
+    if not is_newer_seq(move_seq, last_move_seq.get(cursor_id)):
+        return
+    if not accept_hosted_move(protocol.MOVETO, fields, cursor_dev, move_seq):
+        return
+    last_move_seq[cursor_id] = move_seq
+
+    x, y = cursor_dev.position
+    size = cursor_dev.cursor_size
+    valid = (
+        0 <= new_x <= WIDTH - size
+        and 0 <= new_y <= HEIGHT - size
+        and (pi == MY_PI_ID or (pi in devices and devices[pi].alive))
+    )
+    if not valid:
+        log.warning("moveto_rejected", cursor=cursor_id, pi=pi, x=new_x, y=new_y)
+        confirm_move(cursor_dev, move_seq, MY_PI_ID, x, y)
+        return
+
+    log.debug("moveto", cursor=cursor_id, x=x, y=y, pi=pi, new_x=new_x, new_y=new_y)
+    confirm_move(cursor_dev, move_seq, pi, new_x, new_y)
+    if pi != MY_PI_ID or [new_x, new_y] != cursor_dev.position:
+        move_hosted_cursor(cursor_dev, pi, new_x, new_y, cursor_dev.addr)
+
+def handle_draw(fields, sender_id): # 他のPiのカーソルを新たに描画
+    x, y, pi, cursor_id = fields
+    cursor_pi = devices.get(pi)
+    if cursor_pi.alive is False:
+        log.debug("draw_dead_cursor", cursor=cursor_id)
+        return
+    cursor_pi.onMyPi = True
+    cursor_pi.position = [x, y]
+    handoff_forward.pop(cursor_id, None)
+    cursor_enter(x, y, cursor_pi.color, cursor_id)
+    log.debug("draw", cursor=cursor_id, x=x, y=y)
+
+def handle_cross(fields, sender_id): # 自身のカーソルが遷移
     global my_cursor_locator
-    global exit_flag
-    
-    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
-        sock.bind((MY_PI.addr, DST_PORT))
-        while True:
-            data, addr_port = sock.recvfrom(BUFFER_SIZE)
-            
-            msg = data.decode()
-            print(f"Received {msg} from {addr_port[0]}")
-            parts = msg.split(' ')
-            command = parts[0]
-
-            if time.time() < operation_lock_until and command in {"MOVE", "DRAW", "CROSS"}:
-                continue
-           
-
-            if command == "MOVE":
-                direction = parts[1]
-                cursor_id = int(parts[2])
-
-
-
-                # 送信元Piを特定（操作しているPi）
-                sender_ip = addr_port[0]
-                sender_id = addr_to_id.get(sender_ip)
-                sender = devices[sender_id]
-
-                # 実際に動かすカーソルのデバイス情報
-                cursor_dev = devices[cursor_id]
-
-                if cursor_dev.alive is False:
-                    print(f"[MOVE] Cursor {cursor_id} is not alive, skipping move.")
-                    continue
-
-                if freeze_until.get(cursor_id, 0) > time.time():
-                    print(f"[MOVE] Cursor {cursor_id} is frozen, ignoring move.")
-                    continue
-
-                # カーソルの現在位置
-                x = cursor_dev.position[0]
-                y = cursor_dev.position[1]
-
-                # 移動先座標の計算と遷移判定
-                new_x, new_y, hasCrossed = get_new_position(
-                    x,
-                    y,
-                    direction,
-                    cursor_dev.cursor_size,
-                    current_move_step(cursor_id),
-                    MY_PI.adj,
-                )
-                print(f"[MOVE] cursor_id={cursor_id} (x, y)=({x}, {y}), new=({new_x}, {new_y})")
-
-                if hasCrossed: # 座標の境界を超える
-                    next_pi = get_next_pi(direction, MY_PI.adj)
-                    if next_pi == -1:
-                        print(f"[MOVE] Cannot move {direction}, no adjacent alive Pi.")
-                        continue  # 無効な移動先なので処理スキップ
-                    if next_pi == MY_PI_ID:
-                        #if is_movable(new_x, new_y): # 重複判定
-                        cursor_leave(x, y, cursor_id)
-                        cursor_enter(new_x, new_y, cursor_dev.color, cursor_id)
-                        cursor_dev.position = [new_x, new_y]
-                    else:
-                        send_message(f"CROSS {next_pi} {new_x} {new_y} {cursor_id}", sender.addr)
-                        cursor_dev.onMyPi = False
-                        cursor_leave(x, y, cursor_id)
-                else:
-                    #update_position(x, y, new_x, new_y, cursor_dev)
-                    cursor_leave(x, y, cursor_id)
-                    cursor_enter(new_x, new_y, cursor_dev.color, cursor_id)
-                    cursor_dev.position = [new_x, new_y]
-
-            elif command == "DRAW": # 他のPiのカーソルを新たに描画
-                x, y, pi, cursor_id = int(parts[1]), int(parts[2]), int(parts[3]), int(parts[4])
-                cursor_pi = devices.get(pi)
-                if cursor_pi.alive is False:
-                    print(f"[MOVE] Cursor {cursor_id} is not alive, skipping move.")
-                    continue
-                cursor_pi.onMyPi = True
-                cursor_pi.position = [x, y]
-                cursor_enter(x, y, cursor_pi.color, cursor_id)
-                print(f"[DRAW] cursor_id={cursor_id}, {cursor_pi.position}")
-            
-            elif command == "CROSS": # 自身のカーソルが遷移
-                next_pi, x, y, cursor_id = int(parts[1]), int(parts[2]), int(parts[3]), int(parts[4])
-                print(f"[CROSS] cursor_id={cursor_id}")
-                if next_pi == MY_PI_ID: # 遷移先が自身のPi
-                    MY_PI.onMyPi = True
-                    MY_PI.position = [x, y]
-                    cursor_enter(x, y, MY_PI.color, cursor_id)
-                else:
-                    next_addr = devices.get(next_pi).addr
-                    send_message(f"DRAW {x} {y} {MY_PI_ID} {cursor_id}", next_addr)
-                    my_cursor_locator = next_addr
-            elif command == "SHUFFLE":
-                new_order = list(map(int, parts[1].split(',')))
-                handle_shuffle(new_order)
-            elif command == "PURPLE":
-                target_pi = int(parts[1])
-                x = int(parts[2])
-                y = int(parts[3])
-                purple_info["pi"] = target_pi
-                purple_info["pos"] = (x, y)
-                purple_info["active"] = True
-                if MY_PI_ID == target_pi:
-                    sense.set_pixel(x, y, PURPLE)
-            elif command == "BOOST":
-                cid = int(parts[1])
-                speed_boost_until[cid] = time.time() + BOOST_DURATION
-                if purple_info["active"] and purple_info["pi"] == MY_PI_ID:
-                    sense.set_pixel(purple_info["pos"][0], purple_info["pos"][1], CLEAR)
-                purple_info["active"] = False
-            elif command == "FREEZE":
-                cid = int(parts[1])
-                freeze_until[cid] = time.time() + BOOST_DURATION
-                if purple_info["active"] and purple_info["pi"] == MY_PI_ID:
-                    sense.set_pixel(purple_info["pos"][0], purple_info["pos"][1], CLEAR)
-                purple_info["active"] = False
-            elif command == "CATCH":
-                num = int(parts[1])
-                caught_ids = list(map(int, parts[2:2+num])) #捕獲された逃走者のID
-                print(f"[CATCH] Received catch list: {caught_ids}")
-                # devicesのalive情報を更新
-                for cid in caught_ids:
-                    devices[cid].alive = False  #@
-                    print(f"[CATCH] Marked Pi{cid} as not alive.")
-                    if cid in layout:
-                        layout.remove(cid)
-                    if devices[cid].onMyPi:
-                        cursor_leave(devices[cid].position[0], devices[cid].position[1], cid)
-                        devices[cid].onMyPi = False
-
-                # Update adjacency info for remaining devices
-                for dev_id, adj in compute_adj_from_layout(layout).items():
-                    devices[dev_id].adj = adj
-                    print(f"[CATCH] Reconnected Pi{dev_id}: adj={devices[dev_id].adj}")
-
-
-                # 自分自身が捕まっているかチェックして終了処理
-                if MY_PI_ID in caught_ids and MY_PI_ID != HUNTER_ID:
-                    print(f"[CATCH] You (Pi{MY_PI_ID}, {get_color_name(devices[MY_PI_ID].color)}) were caught by the hunter.")
-                    local_alive_devices = [dev for dev in devices.values() if dev.alive and dev.onMyPi]
-                    print(f"[CATCH] Local alive devices on Pi{MY_PI_ID}: {[dev.id for dev in local_alive_devices]}")
-
-                    # === ここでテレポート処理を追加 ===
-                    alive_pi_ids = [dev.id for dev in devices.values() if dev.alive] #テレポート先候補
-                    random.shuffle(alive_pi_ids) 
-                    for dev, target_pi_id in zip(local_alive_devices, alive_pi_ids):
-                        target_x = random_coordinate(WIDTH - dev.cursor_size, dev.move_step)
-                        target_y = random_coordinate(HEIGHT - dev.cursor_size, dev.move_step)
-                        dest_pos = [target_x, target_y]
-
-                        print(f"[CATCH] Teleporting Pi{dev.id} to Pi{target_pi_id} at {dest_pos}")
-
-                        if target_pi_id == MY_PI_ID:
-                            # 自分のPiなら直接描画
-                            cursor_leave(dev.position[0], dev.position[1], dev.id)
-                            dev.position = dest_pos
-                            cursor_enter(dest_pos[0], dest_pos[1], dev.color, dev.id)
-                        else:
-                            # 他のPiに転送
-                            send_message(f"CROSS {target_pi_id} {dest_pos[0]} {dest_pos[1]} {dev.id}", dev.addr)
-                            cursor_leave(dev.position[0], dev.position[1], dev.id)
-
-                    #MY_PI.alive = False
-                    sense.show_message("CAUGHT!", text_colour=RED)
-                    time.sleep(1.5)
-                    sense.clear()
-                   
-                    return    # スレッド終了
-
-            elif command == "CHECK":
-                x, y, cursor_pi, cursor_id = int(parts[1]), int(parts[2]), int(parts[3]), int(parts[4])
-                device = devices.get(cursor_pi)
-                
-                if device.id == MY_PI_ID: MY_PI.onMyPi = True
-                
-                cursor_enter(x, y, device.color, cursor_id)
-                device.position = [x, y]
+    next_pi, x, y, cursor_id = fields
+    log.debug("cross", cursor=cursor_id, pi=next_pi, x=x, y=y)
+    if next_pi == MY_PI_ID: # 遷移先が自身のPi
+        MY_PI.onMyPi = True
+        MY_PI.position = [x, y]
+        cursor_enter(x, y, MY_PI.color, cursor_id)
+    else:
+        next_addr = devices.get(next_pi).addr
+        send_message(protocol.DRAW, (x, y, MY_PI_ID, cursor_id), next_addr)
+        my_cursor_locator = next_addr
+        predictor.reset((next_pi, x, y))
+
+def handle_confirm(fields, sender_id): # ホストPiからの移動結果
+    cursor_id, move_seq, pi, x, y = fields
+    if cursor_id != MY_PI_ID or MY_PI.onMyPi:
+        return
+    corrections = predictor.corrections
+    predictor.confirm(move_seq, (pi, x, y))
+    if predictor.corrections != corrections:
+        log.info("prediction_corrected", pi=pi, x=x, y=y, seq=move_seq)
 
-# メイン関数（クライアントプログラム）
-if __name__ == "__main__":
+def handle_locate(fields, sender_id): # handoff 後の自カーソルの居場所
+    global my_cursor_locator
+    cursor_id, host_pi = fields
+    log.debug("locate", cursor=cursor_id, pi=host_pi)
+    if cursor_id == MY_PI_ID and not MY_PI.onMyPi:
+        my_cursor_locator = devices[host_pi].addr
+
+def handle_shuffle_message(fields, sender_id):
+    handle_shuffle(list(fields[1:]), fields[0])
+
+def handle_purple(fields, sender_id):
+    target_pi, x, y = fields
+    purple_info["pi"] = target_pi
+    purple_info["pos"] = (x, y)
+    purple_info["active"] = True
+    if MY_PI_ID == target_pi:
+        redraw_area(x, y, 1)
+
+def handle_boost(fields, sender_id):
+    cid, until = fields
+    speed_boost_until[cid] = clock.to_local(until)
+    was_here = purple_info["active"] and purple_info["pi"] == MY_PI_ID
+    purple_info["active"] = False
+    if was_here:
+        redraw_area(purple_info["pos"][0], purple_info["pos"][1], 1)
+
+def handle_freeze(fields, sender_id):
+    cid, until = fields
+    freeze_until[cid] = clock.to_local(until)
+    was_here = purple_info["active"] and purple_info["pi"] == MY_PI_ID
+    purple_info["active"] = False
+    if was_here:
+        redraw_area(purple_info["pos"][0], purple_info["pos"][1], 1)
+
+def handle_catch(fields, sender_id):
+    caught_ids = list(fields) #捕獲された逃走者のID
+    log.info("catch", caught=caught_ids)
+    # devicesのalive情報を更新
+    for cid in caught_ids:
+        devices[cid].alive = False  #@
+        if cid in layout:
+            layout.remove(cid)
+        if devices[cid].onMyPi:
+            cursor_leave(devices[cid].position[0], devices[cid].position[1], cid)
+            devices[cid].onMyPi = False
+
+    # Update adjacency info for remaining devices
+    for dev_id, adj in compute_adj_from_layout(layout).items():
+        devices[dev_id].adj = adj
+        log.debug("reconnected", pi=dev_id, adj=adj)
+    record_state()
+    log.info("flight_dump", reason="catch", path=recorder.dump("catch"))
+
+
+    # 自分自身が捕まっているかチェックして終了処理
+    if MY_PI_ID in caught_ids and MY_PI_ID != HUNTER_ID:
+        local_alive_devices = [dev for dev in devices.values() if dev.alive and dev.onMyPi]
+        log.info("caught", pi=MY_PI_ID, local_cursors=[dev.id for dev in local_alive_devices])
+
+        # === ここでテレポート処理を追加 ===
+        alive_pi_ids = [dev.id for dev in devices.values() if dev.alive] #テレポート先候補
+        random.shuffle(alive_pi_ids) 
+        for dev, target_pi_id in zip(local_alive_devices, alive_pi_ids):
+            target_x = random_coordinate(WIDTH - dev.cursor_size, dev.move_step)
+            target_y = random_coordinate(HEIGHT - dev.cursor_size, dev.move_step)
+            dest_pos = [target_x, target_y]
+
+            log.info("teleport", cursor=dev.id, pi=target_pi_id, x=dest_pos[0], y=dest_pos[1])
+
+            if target_pi_id == MY_PI_ID:
+                # 自分のPiなら直接描画
+                cursor_leave(dev.position[0], dev.position[1], dev.id)
+                dev.position = dest_pos
+                cursor_enter(dest_pos[0], dest_pos[1], dev.color, dev.id)
+            else:
+                # 他のPiに転送
+                send_message(protocol.CROSS, (target_pi_id, dest_pos[0], dest_pos[1], dev.id), dev.addr)
+                cursor_leave(dev.position[0], dev.position[1], dev.id)
+
+        #MY_PI.alive = False
+        return True    # 受信終了
+
+def handle_check(fields, sender_id):
+    x, y, cursor_pi, cursor_id = fields
+    device = devices.get(cursor_pi)
+    
+    if device.id == MY_PI_ID: MY_PI.onMyPi = True
     
+    cursor_enter(x, y, device.color, cursor_id)
+    device.position = [x, y]
+
+# opcode -> ハンドラ
+HANDLERS = {
+    protocol.MOVE: handle_move,
+    protocol.DRAW: handle_draw,
+    protocol.CROSS: handle_cross,
+    protocol.SHUFFLE: handle_shuffle_message,
+    protocol.PURPLE: handle_purple,
+    protocol.BOOST: handle_boost,
+    protocol.FREEZE: handle_freeze,
+    protocol.CATCH: handle_catch,
+    protocol.CHECK: handle_check,
+    protocol.LOCATE: handle_locate,
+    protocol.CONFIRM: handle_confirm,
+    protocol.MOVETO: handle_moveto,
+}
 
-     # 制限時間タイマをスタート
-    timer = threading.Timer(TIME, timeout_handler)
-    timer.start()
+# 受信したコマンドのフィールドの範囲。ハンドラは devices[...] や座標をそのまま使うので、キューに積む前に検査する
+PI_IDS = devices                       # カーソル id・Pi id
+XS, YS = range(WIDTH), range(HEIGHT)
+DIRECTION_INDEXES = range(len(protocol.DIRECTIONS))
+# opcode -> フィールドごとの範囲（None は検査しない）
+FIELD_RANGES = {
+    protocol.MOVE: (DIRECTION_INDEXES, PI_IDS, None),
+    protocol.DRAW: (XS, YS, PI_IDS, PI_IDS),
+    protocol.CROSS: (PI_IDS, XS, YS, PI_IDS),
+    protocol.PURPLE: (PI_IDS, XS, YS),
+    protocol.BOOST: (PI_IDS, None),
+    protocol.FREEZE: (PI_IDS, None),
+    protocol.CHECK: (XS, YS, PI_IDS, PI_IDS),
+    protocol.LOCATE: (PI_IDS, PI_IDS),
+    protocol.CONFIRM: (PI_IDS, None, PI_IDS, XS, YS),
+    protocol.MOVETO: (PI_IDS, None, PI_IDS, XS, YS),
+}
+# リスト型: opcode -> (prefix の範囲, 要素の範囲)
+LIST_FIELD_RANGES = {
+    protocol.CATCH: ((), PI_IDS),
+    protocol.SHUFFLE: ((None,), PI_IDS),
+}
 
-    # Initialization
-    listener_thread = threading.Thread(target=network_listener, daemon=True)
-    listener_thread.start()
+def invalid_field(msg):
+    """Describe the first out-of-range id or coordinate of a received command, or None."""
+    if msg.sender not in PI_IDS:
+        return f"unknown sender {msg.sender}"
+    ranges = FIELD_RANGES.get(msg.opcode)
+    if ranges is None:
+        prefix, element = LIST_FIELD_RANGES[msg.opcode]
+        ranges = prefix + (element,) * (len(msg.fields) - len(prefix))
+    for i, (allowed, value) in enumerate(zip(ranges, msg.fields)):
+        if allowed is not None and value not in allowed:
+            return f"field {i} out of range: {value}"
+    return None
 
-    if MY_PI_ID == HUNTER_ID:
-        purple_thread = threading.Thread(target=purple_spawn_loop, daemon=True)
-        purple_thread.start()
+# シャッフル中に無視するコマンド。DRAW / CROSS は ACK 済みで再送されず、捨てるとカーソルが消えるので通す
+LOCKED_OPCODES = {protocol.MOVE, protocol.MOVETO}
+
+# 受信キューの優先度（上のグループほど先に処理する）
+RECEIVE_PRIORITIES = priority_table([
+    (protocol.CATCH, protocol.SHUFFLE, protocol.FREEZE),
+    (protocol.BOOST, protocol.PURPLE, protocol.DRAW, protocol.CROSS, protocol.LOCATE, protocol.CHECK),
+    (protocol.CONFIRM,),
+    (protocol.MOVE, protocol.MOVETO),
+])
+# 相対移動の MOVE はこれ以上待たされたら捨てる（秒）
+MOVE_STALE_AFTER = 2 * TIME_INTERVAL
+
+receive_queue = PriorityReceiveQueue(
+    RECEIVE_PRIORITIES,
+    default_priority=len(set(RECEIVE_PRIORITIES.values())),
+    # MOVETO はカーソルごとに最新の 1 個だけ処理すればよい
+    latest_only={protocol.MOVETO: 0},
+    stale_after={protocol.MOVE: MOVE_STALE_AFTER},
+)
+
+# sense.show_message と同じスクロールを事前に計算しておき、最後に 1.5 秒空白で止める
+CAUGHT_FRAMES = text_frames(sense, "CAUGHT!", RED) + still([CLEAR] * 64, 1.5)
+
+async def show_caught():
+    """Scroll the CAUGHT! banner without blocking the event loop."""
+    done = asyncio.get_running_loop().create_future()
+    animator.cancel()
+    animator.play(CAUGHT_FRAMES, lambda: done.set_result(None))
+    await done
+    fb.clear()
 
-    sense.clear()
-    draw_cursor(MY_PI.position[0], MY_PI.position[1], MY_PI.color, MY_PI.cursor_size)
+# ネットワークリスナー（サーバプログラム）
+class NodeProtocol(asyncio.DatagramProtocol):
+    """Receive commands on the node socket and queue them for dispatch_loop."""
+
+    def __init__(self):
+        self.closed = False
+        # 自分が捕まった時の表示タスク
+        self.caught_task = None
+
+    def datagram_received(self, data, addr_port):
+        try:
+            msg = protocol.decode(data)
+        except protocol.ProtocolError as e:
+            log.warning("bad_datagram", src=addr_port[0], error=str(e))
+            datagrams_dropped.inc("malformed")
+            return
+        recorder.record("recv", msg.opcode, msg.seq, msg.fields, addr_port[0])
+        messages_received.inc(protocol.opcode_name(msg.opcode))
+
+        if msg.opcode == protocol.ACK:
+            reliable.on_ack(msg.fields, addr_port[0])
+            return
+        # 時刻合わせはキューを通さず、受信した瞬間の時刻で処理する
+        if msg.opcode == protocol.TIME_REQ:
+            t1 = clock.now()
+            send_message(protocol.TIME_RESP, (msg.fields[0], t1, clock.now()), addr_port[0])
+            return
+        if msg.opcode == protocol.TIME_RESP:
+            clock.on_response(*msg.fields, time.time())
+            session.clock_offset(clock.offset)
+            return
+        if msg.opcode in RELIABLE_OPCODES and not reliable.accept(msg.sender, msg.seq, addr_port[0]):
+            datagrams_dropped.inc("duplicate")
+            return  # 再送された重複
+        # 捕まった後も ACK の処理と返信は続ける（止めると相手が再送し続ける）。ゲームのコマンドだけ捨てる
+        if self.closed:
+            return
+        problem = invalid_field(msg)
+        if problem is not None:
+            log.warning("invalid_command", op=protocol.opcode_name(msg.opcode), src=addr_port[0], error=problem)
+            datagrams_dropped.inc("invalid")
+            return
+        span(msg.trace, "recv")
+        receive_queue.put(msg, addr_port, data)
+
+    def error_received(self, exc):
+        log.warning("socket_error", error=str(exc))
+
+def dispatch(msg, data) -> bool:
+    """Run the handler for one queued command; True once this Pi was caught.
+
+    ``data`` is the datagram ``msg`` was decoded from, recorded as is.
+    """
+    global current_trace
+    session.dispatch(data)
+    if time.time() < operation_lock_until and msg.opcode in LOCKED_OPCODES:
+        return False
+
+    current_trace = msg.trace
+    span(current_trace, "dispatch")
+    started = time.perf_counter()
+    try:
+        caught = HANDLERS[msg.opcode](msg.fields, msg.sender)
+    except Exception:
+        # 記録・ダンプしてこのコマンドだけ捨て、次のコマンドへ進む
+        recorder.record("exception", msg.opcode, msg.fields, traceback.format_exc())
+        log.error("handler_failed", op=protocol.opcode_name(msg.opcode), path=recorder.dump("exception"))
+        handler_errors.inc(protocol.opcode_name(msg.opcode))
+        caught = False
+    current_trace = 0
+    record_state()
+    handler_seconds.observe(time.perf_counter() - started, protocol.opcode_name(msg.opcode))
+    return caught
+
+async def dispatch_loop(node_protocol):
+    """Run queued commands in priority order, one per event loop turn."""
+    while True:
+        msg, addr_port, data = await receive_queue.get()
+        log.debug("recv", op=protocol.opcode_name(msg.opcode), fields=msg.fields, src=addr_port[0], sender=msg.sender)
+        try:
+            caught = dispatch(msg, data)
+        except Exception as e:
+            # 1 件のコマンドの失敗でノードを止めない（ハンドラの例外は dispatch の中で処理済み）
+            log.error("dispatch_failed", op=protocol.opcode_name(msg.opcode), error=repr(e))
+            caught = False
+        if caught:
+            node_protocol.closed = True
+            node_protocol.caught_task = asyncio.ensure_future(show_caught())
+            return
+
+        # 1 件ごとにループへ戻し、新しく届いた高優先度のコマンドを先に積めるようにする
+        await asyncio.sleep(0)
+
+async def clock_sync_loop():
+    """Periodically measure the offset to the reference node's clock."""
+    reference_addr = devices[CLOCK_REFERENCE_ID].addr
+    sent = 0
+    while True:
+        send_message(protocol.TIME_REQ, (time.time(),), reference_addr)
+        sent += 1
+        await asyncio.sleep(0.1 if sent < CLOCK_SYNC_BURST else CLOCK_SYNC_INTERVAL)
+
+# ゲームループの刻み。センサ読み取り・移動・描画を 1 tick の中で順に行う
+TICK_HZ = 1 / TIME_INTERVAL
+# tick が期限を超えた時に連続で追いつく最大 tick 数（それ以上は飛ばす）
+MAX_CATCH_UP_TICKS = 2
+ticker = TickScheduler(TICK_HZ, max_catch_up=MAX_CATCH_UP_TICKS)
+
+def move_phase(direction):
+    """Move this Pi's cursor one step, or send the move to the hosting Pi."""
+    global my_cursor_locator
+
+    if MY_PI.onMyPi:
+        x, y = MY_PI.position
+        new_x, new_y, hasCrossed = get_new_position(
+            x,
+            y,
+            direction,
+            MY_PI.cursor_size,
+            current_move_step(MY_PI.id),
+            MY_PI.adj,
+        )
+
+        if hasCrossed: # 座標の境界を超える
+            next_pi = get_next_pi(direction, MY_PI.adj)
+            if next_pi == -1:
+                log.debug("move_blocked", cursor=MY_PI_ID, direction=direction)
+                return  # 無効な移動先なので処理スキップ
+            if next_pi == MY_PI_ID:
+                #if is_movable(new_x, new_y): # 重複判定
+                    cursor_leave(x, y, MY_PI.id)
+                    cursor_enter(new_x, new_y, MY_PI.color, MY_PI.id)
+                    MY_PI.position = [new_x, new_y]
+            else: # 他のPiに遷移
+                send_message(protocol.DRAW, (new_x, new_y, MY_PI_ID, MY_PI.id), devices.get(next_pi).addr)
+                cursor_leave(x, y, MY_PI.id)
+                MY_PI.onMyPi = False
+                my_cursor_locator = devices.get(next_pi).addr
+                predictor.reset((next_pi, new_x, new_y))
+        else: 
+            #update_position(x, y, new_x, new_y, MY_PI)
+            cursor_leave(x, y, MY_PI.id)
+            cursor_enter(new_x, new_y, MY_PI.color, MY_PI.id)
+            MY_PI.position = [new_x, new_y]
+    else:
+        move_seq = predictor.predict(direction)
+        move_target["trace"] = current_trace
+        if not ABSOLUTE_MOVES:
+            send_message(protocol.MOVE, (protocol.DIRECTIONS.index(direction), MY_PI.id, move_seq), my_cursor_locator)
+
+def game_tick() -> bool:
+    """Input and movement phases of one tick; False once the game is over."""
+    global current_trace
+    now = time.monotonic()
+    session.tick(now)
+    if time.time() > operation_lock_until and check_shuffle_button():
+        trigger_shuffle()
+        return True
+
+    if time.time() < operation_lock_until:
+        return True
+
+    if timer_triggered:
+        return True  # 制限時間切れ後は動かさない
+
+    if ONI and isAllDeath():
+        return False
+
+    direction = get_direction()
+
+    if freeze_until.get(MY_PI_ID, 0) > time.time():
+        return True
+
+    if direction:
+        current_trace = new_trace()
+        if current_trace and imu.last_sample_at is not None:
+            span(current_trace, "sample", clock.now() - (time.monotonic() - imu.last_sample_at))
+        span(current_trace, "tick")
+        move_phase(direction)
+
+    if ABSOLUTE_MOVES and not MY_PI.onMyPi:
+        send_move_target(now)
+    current_trace = 0
+    return True
+
+async def game_loop():
+    """Run the tick phases on fixed TICK_HZ deadlines until the game ends."""
+    due = 1
+    while not exit_flag and MY_PI.alive==True:
+        # 期限に遅れた分は追いつき tick としてまとめて進め、描画は最後に 1 回だけ行う
+        started = time.perf_counter()
+        for _ in range(due):
+            if not game_tick():
+                return
+        flush_frame()
+        elapsed = time.perf_counter() - started
+        tick_seconds.observe(elapsed)
+        recorder.record("tick", due, elapsed)
+        record_state()
+        due = await ticker.wait()
+
+# 他のモジュールがすでに数えている値は、スクレイプされた時にだけ読む
+def _receive_queue_counts(key):
+    return lambda: {(name,): s[key] for name, s in receive_queue.stats(protocol.opcode_name)["opcodes"].items()}
+
+registry.counter("node_receive_queue_handled_total", "Commands taken from the receive queue, by opcode.", ("op",),
+                 fn=_receive_queue_counts("handled"))
+registry.counter("node_receive_queue_dropped_total", "Stale or superseded commands dropped from the receive queue.", ("op",),
+                 fn=_receive_queue_counts("dropped"))
+registry.gauge("node_receive_queue_depth", "Commands waiting in the receive queue.", fn=lambda: receive_queue.stats()["depth"])
+registry.counter("node_reliable_retransmits_total", "Retransmissions of unacknowledged commands.",
+                 fn=lambda: reliable.stats["retransmits"])
+registry.counter("node_reliable_gave_up_total", "Reliable commands abandoned after the last retry.",
+                 fn=lambda: reliable.stats["gave_up"])
+registry.counter("node_ticks_total", "Game ticks run.", fn=lambda: ticker.ticks)
+registry.counter("node_tick_overruns_total", "Ticks that started after their deadline.", fn=lambda: ticker.overruns)
+registry.counter("node_ticks_skipped_total", "Ticks dropped because the loop fell too far behind.", fn=lambda: ticker.skipped)
+registry.gauge("node_tick_max_overrun_seconds", "Largest tick overrun so far.", fn=lambda: ticker.max_overrun)
+registry.counter("node_imu_samples_total", "IMU samples read by the sampler thread.", fn=lambda: imu.count)
+registry.counter("node_imu_errors_total", "IMU reads that raised.", fn=lambda: imu.errors)
+registry.counter("node_log_dropped_total", "Event log records dropped because the buffer was full.", fn=lambda: log.dropped)
+registry.gauge("node_clock_offset_seconds", "Estimated offset to the reference node's clock.", fn=lambda: clock.offset)
+registry.counter("node_frame_flushes_total", "Frames written to the LED matrix.", fn=lambda: fb.flushes)
+registry.counter("node_transport_sent_packets_total", "Datagrams sent, by destination address.", ("dst",),
+                 fn=lambda: {(addr,): s["packets"] for addr, s in transport.stats().items()})
+registry.counter("node_transport_sent_bytes_total", "Bytes sent, by destination address.", ("dst",),
+                 fn=lambda: {(addr,): s["bytes"] for addr, s in transport.stats().items()})
+registry.counter("node_predictions_total", "Moves of this Pi's cursor drawn ahead of the host's answer.",
+                 fn=lambda: predictor.predictions)
+registry.counter("node_prediction_hits_total", "Predictions the host confirmed.", fn=lambda: predictor.hits)
+registry.counter("node_prediction_corrections_total", "Predictions the host corrected.", fn=lambda: predictor.corrections)
+registry.counter("node_prediction_stale_confirms_total", "Confirmations for predictions already replaced.",
+                 fn=lambda: predictor.stale)
+registry.gauge("node_predictions_pending", "Predictions waiting for the host's answer.", fn=lambda: len(predictor.pending))
+
+def draw_initial_frame():
+    fb.clear()
+    fb.invalidate()
+    redraw_area(0, 0, max(WIDTH, HEIGHT))
+
+async def main():
+    loop = asyncio.get_running_loop()
+
+    # 受信も送信も transport のソケットをそのまま使う
+    endpoint, node_protocol = await loop.create_datagram_endpoint(NodeProtocol, sock=transport.sock)
+    group_endpoint = None
+    if transport.group_sock is not None:
+        group_endpoint, _ = await loop.create_datagram_endpoint(lambda: node_protocol, sock=transport.group_sock)
+    transport.attach(endpoint, group_endpoint)
+
+     # 制限時間タイマをスタート
+    timer = loop.call_later(TIME, timeout_handler)
+
+    # SIGUSR1: 動かしたままフライトレコーダを書き出す。SIGTERM: 書き出してから終了する
+    def on_signal(signum):
+        global exit_flag
+        log.info("flight_dump", reason="signal", signal=signum, path=recorder.dump(signal.Signals(signum).name.lower()))
+        if signum == signal.SIGTERM:
+            exit_flag = True
+    loop.add_signal_handler(signal.SIGUSR1, on_signal, signal.SIGUSR1)
+    loop.add_signal_handler(signal.SIGTERM, on_signal, signal.SIGTERM)
+
+    tasks = [asyncio.ensure_future(dispatch_loop(node_protocol))]
+    if MY_PI_ID != CLOCK_REFERENCE_ID:
+        tasks.append(asyncio.ensure_future(clock_sync_loop()))
+    if MY_PI_ID == HUNTER_ID:
+        tasks.append(asyncio.ensure_future(purple_spawn_loop()))
 
+    draw_initial_frame()
     print_all_cursor_status()
 
+    log.start()
+    imu.start()
+    metrics_server = None
+    if METRICS_PORT:
+        try:
+            metrics_server = metrics.serve(registry, MY_PI.addr, METRICS_PORT)
+        except OSError as e:
+            log.warning("metrics_unavailable", port=METRICS_PORT, error=str(e))
     try:
-        while not exit_flag and MY_PI.alive==True:
-            if time.time() > operation_lock_until and check_shuffle_button():
-                trigger_shuffle()
-                continue
-
-            if time.time() < operation_lock_until:
-                time.sleep(0.1)
-                # TIME_INTERVALにしたほうがいいかもね
-                continue
-
-            if timer_triggered:
-                print("Time out")
-                time.sleep(10.0)
-
-            if ONI and isAllDeath():
-                exit()
-
-            direction = get_direction()
-
-            if freeze_until.get(MY_PI_ID, 0) > time.time():
-                time.sleep(TIME_INTERVAL)
-                continue
-
-            if direction:
-                if MY_PI.onMyPi:
-                    x, y = MY_PI.position
-                    new_x, new_y, hasCrossed = get_new_position(
-                        x,
-                        y,
-                        direction,
-                        MY_PI.cursor_size,
-                        current_move_step(MY_PI.id),
-                        MY_PI.adj,
-                    )
-
-                    if hasCrossed: # 座標の境界を超える
-                        next_pi = get_next_pi(direction, MY_PI.adj)
-                        if next_pi == -1:
-                            print(f"[MOVE] Cannot move {direction}, no adjacent alive Pi.")
-                            continue  # 無効な移動先なので処理スキップ
-                        if next_pi == MY_PI_ID:
-                            #if is_movable(new_x, new_y): # 重複判定
-                                cursor_leave(x, y, MY_PI.id)
-                                cursor_enter(new_x, new_y, MY_PI.color, MY_PI.id)
-                                MY_PI.position = [new_x, new_y]
-                        else: # 他のPiに遷移
-                            send_message(f"DRAW {new_x} {new_y} {MY_PI_ID} {MY_PI.id}", devices.get(next_pi).addr)
-                            cursor_leave(x, y, MY_PI.id)
-                            MY_PI.onMyPi = False
-                            my_cursor_locator = devices.get(next_pi).addr
-                    else: 
-                        #update_position(x, y, new_x, new_y, MY_PI)
-                        cursor_leave(x, y, MY_PI.id)
-                        cursor_enter(new_x, new_y, MY_PI.color, MY_PI.id)
-                        MY_PI.position = [new_x, new_y]
-                else:
-                    send_message(f"MOVE {direction} {MY_PI.id}", my_cursor_locator)
-            
-            time.sleep(TIME_INTERVAL)
+        await game_loop()
+        if node_protocol.caught_task is not None:
+            await node_protocol.caught_task
+    finally:
+        timer.cancel()
+        for task in tasks:
+            task.cancel()
+        imu.stop()
+        if metrics_server is not None:
+            metrics_server.shutdown()
+        log.close()
+        print(f"[LOG] written={log.written} dropped={log.dropped}")
+        print(f"[PREDICT] {predictor.metrics()}")
+        print(f"[RELIABLE] {reliable.stats}")
+        print(f"[TRANSPORT] {transport.stats()}")
+        print(f"[RECV QUEUE] {receive_queue.stats(protocol.opcode_name)}")
+        print(f"[CLOCK] {clock.stats()}")
+        print(f"[FRAME] flushes={fb.flushes}")
+        if HEADLESS:
+            print(f"[HAT] frame_writes={sense.frame_writes} accel_reads={sense.accel_reads}")
+        print(f"[TICK] {ticker.stats()}")
+        print(f"[IMU] {imu.stats()}")
+        print(f"[ANIMATION] shown={animator.frames_shown} skipped={animator.frames_skipped}")
+        reliable.close()
+        transport.close()
+        session.close()
 
+# メイン関数（クライアントプログラム）
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
     except KeyboardInterrupt:
+        print(f"Flight record: {recorder.dump('sigint')}")
         print("プログラムを終了します。")
     finally:
         sense.clear()
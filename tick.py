@@ -0,0 +1,66 @@
+"""Fixed-timestep ticks on ``time.monotonic()`` deadlines.
+
+Tick ``n`` is due at ``start + n * period`` no matter how long the
+previous ticks took, so processing time does not stretch the interval.
+When a tick overruns past one or more later deadlines, up to
+``max_catch_up`` of the missed ticks are run back to back and the rest
+are skipped.
+"""
+import asyncio
+import time
+
+
+class TickScheduler:
+    def __init__(self, hz: float, max_catch_up: int = 0, clock=time.monotonic):
+        self.period = 1.0 / hz
+        self.max_catch_up = max_catch_up
+        self.clock = clock
+        self.deadline = None
+        self.ticks = 0
+        self.overruns = 0
+        self.caught_up = 0
+        self.skipped = 0
+        self.total_overrun = 0.0
+        self.max_overrun = 0.0
+        # sleep から戻るのが期限より遅れた最大値
+        self.max_wake_late = 0.0
+
+    async def wait(self) -> int:
+        """Sleep until the next deadline; returns how many ticks to run now (>= 1)."""
+        now = self.clock()
+        if self.deadline is None:
+            self.deadline = now
+        next_deadline = self.deadline + self.period
+        overrun = now - next_deadline
+        due = 1
+        if overrun > 0:
+            missed = int(overrun // self.period)
+            self.overruns += 1
+            self.total_overrun += overrun
+            self.max_overrun = max(self.max_overrun, overrun)
+            extra = min(missed, self.max_catch_up)
+            self.caught_up += extra
+            self.skipped += missed - extra
+            due += extra
+            # 間に合わなかった期限は飛ばし、格子 start + n * period に乗ったまま進む
+            next_deadline += missed * self.period
+            # 遅れていても一度はループへ戻し、受信やアニメーションのタスクを飢えさせない
+            await asyncio.sleep(0)
+        else:
+            await asyncio.sleep(-overrun)
+            self.max_wake_late = max(self.max_wake_late, self.clock() - next_deadline)
+        self.deadline = next_deadline
+        self.ticks += due
+        return due
+
+    def stats(self):
+        return {
+            "hz": 1.0 / self.period,
+            "ticks": self.ticks,
+            "overruns": self.overruns,
+            "caught_up": self.caught_up,
+            "skipped": self.skipped,
+            "avg_overrun": self.total_overrun / self.overruns if self.overruns else 0.0,
+            "max_overrun": self.max_overrun,
+            "max_wake_late": self.max_wake_late,
+        }
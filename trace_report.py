@@ -0,0 +1,82 @@
+"""Per-hop tilt-to-LED latency from the nodes' trace spans.
+
+Nodes started with NODE_TRACE_SAMPLE > 0 give that fraction of their
+moves a trace id.  The id travels with the MOVE / MOVETO / DRAW messages
+the move causes (see ``protocol.TRACED``), and every node it passes logs
+a ``span`` event with the cluster time of each stage:
+
+    sample    newest IMU reading when the tick read the direction
+    tick      the game tick acting on the direction
+    send      a traced command leaves a node
+    recv      the datagram arrives (before the receive queue)
+    dispatch  its handler starts
+    enter     cursor_enter draws the cursor into the frame buffer
+    flush     the frame holding it is written to the LED matrix
+
+Spans of one trace are ordered by time, so a cursor handed over between
+several Pis yields repeated send/recv/dispatch hops.  Reports each hop
+(``stage -> next stage``) and the end-to-end time from ``sample`` to the
+last ``flush``, split into moves drawn locally and on another Pi.
+
+Usage: python trace_report.py LOG [LOG ...]
+"""
+import json
+import statistics
+import sys
+from collections import defaultdict
+from typing import Dict, Iterable, List
+
+STAGES = ("sample", "tick", "send", "recv", "dispatch", "enter", "flush")
+_RANK = {stage: i for i, stage in enumerate(STAGES)}
+
+
+def read_spans(lines: Iterable[str]) -> Dict[int, List[dict]]:
+    """Group the ``span`` events found in event log lines by trace id."""
+    traces = defaultdict(list)
+    for line in lines:
+        if not line.startswith("{"):
+            continue
+        record = json.loads(line)
+        if record["event"] == "span":
+            traces[record["trace"]].append(record)
+    return traces
+
+
+def hop_latencies(traces: Dict[int, List[dict]]) -> Dict[str, List[float]]:
+    """Seconds spent between consecutive stages, keyed ``"a -> b"``."""
+    hops = defaultdict(list)
+    for spans in traces.values():
+        # 同時刻の span は段階の順に並べる（時刻合わせの誤差より細かい差は気にしない）
+        spans = sorted(spans, key=lambda s: (s["at"], _RANK[s["stage"]]))
+        for a, b in zip(spans, spans[1:]):
+            hops[f"{a['stage']} -> {b['stage']}"].append(b["at"] - a["at"])
+        flushes = [s["at"] for s in spans if s["stage"] == "flush"]
+        if spans[0]["stage"] == "sample" and flushes:
+            where = "remote" if any(s["stage"] == "recv" for s in spans) else "local"
+            hops[f"total ({where})"].append(flushes[-1] - spans[0]["at"])
+    return hops
+
+
+def print_report(hops: Dict[str, List[float]], traces: int):
+    print(f"{traces} traces")
+    print(f"{'hop':<22}{'count':>7}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}")
+    for name, values in sorted(hops.items(), key=lambda item: (item[0].startswith("total"), item[0])):
+        values.sort()
+        p95 = values[min(len(values) - 1, int(len(values) * 0.95))]
+        print(f"{name:<22}{len(values):>7}{statistics.median(values) * 1000:>10.2f}"
+              f"{p95 * 1000:>10.2f}{values[-1] * 1000:>10.2f}")
+
+
+def main():
+    if len(sys.argv) < 2:
+        sys.exit(__doc__.strip().splitlines()[-1])
+    traces = defaultdict(list)
+    for path in sys.argv[1:]:
+        with open(path) as f:
+            for trace, spans in read_spans(f).items():
+                traces[trace].extend(spans)
+    print_report(hop_latencies(traces), len(traces))
+
+
+if __name__ == "__main__":
+    main()
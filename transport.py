@@ -0,0 +1,92 @@
+import socket
+import threading
+from collections import Counter
+from typing import Iterable
+
+
+class UdpTransport:
+    """Long-lived UDP socket shared by every send and receive of one node.
+
+    Opening a fresh socket per datagram is expensive on a Pi Zero, so the
+    node binds a single socket at start-up and reuses it for the listener
+    and for all outgoing commands.
+    """
+
+    def __init__(self, bind_addr: str, port: int):
+        self.port = port
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind((bind_addr, port))
+        # 宛先ごとの送信回数・送信バイト数
+        self.sent_packets: Counter = Counter()
+        self.sent_bytes: Counter = Counter()
+        self._lock = threading.Lock()
+        # asyncio の DatagramTransport（attach 後はこちらから送信する）
+        self._endpoint = None
+        # マルチキャスト（join_group 後に設定される）
+        self.group = None
+        self.group_sock = None
+        self._group_endpoint = None
+
+    def attach(self, endpoint, group_endpoint=None):
+        """Route sends through an asyncio DatagramTransport built on ``sock``."""
+        self._endpoint = endpoint
+        self._group_endpoint = group_endpoint
+
+    def join_group(self, group: str, iface_addr: str, ttl: int = 1):
+        """Send fan-out traffic to ``group`` and receive it on ``group_sock``.
+
+        ``sock`` is bound to the node's unicast address, which the kernel
+        does not match against multicast destinations, so group traffic is
+        received on a second socket bound to the group address.
+        """
+        iface = socket.inet_aton(iface_addr)
+        rsock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            rsock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            rsock.bind((group, self.port))
+            rsock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, socket.inet_aton(group) + iface)
+            self.sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_IF, iface)
+            self.sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, ttl)
+        except OSError:
+            rsock.close()
+            raise
+        self.group = group
+        self.group_sock = rsock
+
+    def send_group(self, data: bytes):
+        """Send one datagram to every member of the joined group."""
+        self.sendto(data, self.group)
+
+    def sendto(self, data: bytes, dst_addr: str, dst_port: int = None):
+        port = self.port if dst_port is None else dst_port
+        if self._endpoint is not None:
+            self._endpoint.sendto(data, (dst_addr, port))
+        else:
+            self.sock.sendto(data, (dst_addr, port))
+        with self._lock:
+            self.sent_packets[dst_addr] += 1
+            self.sent_bytes[dst_addr] += len(data)
+
+    def send_many(self, data: bytes, dst_addrs: Iterable[str], dst_port: int = None):
+        """Send the same datagram to every address in ``dst_addrs``."""
+        for addr in dst_addrs:
+            self.sendto(data, addr, dst_port)
+
+    def stats(self):
+        """Return a snapshot of per-destination send counters."""
+        with self._lock:
+            return {
+                addr: {"packets": self.sent_packets[addr], "bytes": self.sent_bytes[addr]}
+                for addr in self.sent_packets
+            }
+
+    def close(self):
+        if self._endpoint is not None:
+            self._endpoint.close()
+        else:
+            self.sock.close()
+        if self._group_endpoint is not None:
+            self._group_endpoint.close()
+        elif self.group_sock is not None:
+            self.group_sock.close()